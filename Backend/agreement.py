@@ -0,0 +1,264 @@
+from dotenv import load_dotenv
+from prompt_budget import estimate_tokens, split_units
+from text_vectors import HashingVectorizer, cosine_matrix, jaccard, normalize, numbers, word_overlap, wording, words
+from latency import latency_tracker
+import numpy as np
+import os
+import re
+import threading
+import time
+
+load_dotenv()
+
+# Sentences from different models with TF-IDF cosine >= this, the same
+# numbers and polarity, and mostly the same content words in much the same
+# order are treated as one statement. A one-verb paraphrase ("picks" /
+# "selects a pivot element") scores ~0.75; opposite claims are kept apart by
+# the polarity and opposite-word checks, not by this threshold.
+SHARED_SENTENCE_THRESHOLD = float(os.getenv("SHARED_SENTENCE_THRESHOLD", "0.7"))
+
+# Minimum word_overlap() of two such sentences' content words
+MIN_SHARED_WORD_OVERLAP = 0.6
+
+# Responses whose mean pairwise similarity reaches this (and that state the
+# same numbers, polarity and content words) are answered without a synthesis
+# call. Cosine alone scores "Jupiter" vs "Saturn" answers ~0.89, so it only
+# ranks responses that already say the same thing. Above 1 turns the
+# shortcut off.
+CONSENSUS_THRESHOLD = float(os.getenv("CONSENSUS_THRESHOLD", "0.7"))
+
+# Minimum Jaccard overlap of adjacent content-word pairs for two texts to
+# count as the same statement; "Earth orbits the Sun" / "the Sun orbits
+# Earth" share none.
+MIN_WORD_PAIR_OVERLAP = 0.5
+
+_NEGATION = re.compile(r"\b(?:not|no|never|none|cannot|without)\b|n't", re.IGNORECASE)
+
+# Sentences that differ only by one of these ("Heat" / "Cool the oven to 200
+# degrees") say opposite things
+_OPPOSITES = frozenset(frozenset(pair.split("/")) for pair in """
+heat/cool hot/cold warm/cool increase/decrease increase/reduce raise/lower higher/lower more/less
+before/after add/remove enable/disable open/close start/stop true/false min/max minimum/maximum
+faster/slower larger/smaller above/below first/last left/right ascending/descending
+positive/negative best/worst include/exclude allow/deny accept/reject
+""".split())
+
+# Shorter sentences ("Yes.", "In short:") are too generic to match on
+MIN_SENTENCE_WORDS = 4
+
+_vectorizer = HashingVectorizer()
+
+
+def _clusters(links, n):
+    """Connected components of n items given (i, j) links, as lists of indices."""
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in links:
+        parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _same_statement(a, b):
+    """Whether two wording() results name the same things in much the same order."""
+    return a[0] == b[0] and jaccard(a[1], b[1]) >= MIN_WORD_PAIR_OVERLAP
+
+
+def _opposed(a, b):
+    only_a, only_b = set(a) - set(b), set(b) - set(a)
+    return any(frozenset((x, y)) in _OPPOSITES for x in only_a for y in only_b)
+
+
+def _shared_statement(a, b):
+    """Whether two sentences' content words make mostly the same statement."""
+    return (
+        word_overlap(a, b) >= MIN_SHARED_WORD_OVERLAP
+        and jaccard(frozenset(zip(a, a[1:])), frozenset(zip(b, b[1:]))) >= MIN_WORD_PAIR_OVERLAP
+        and not _opposed(a, b)
+    )
+
+
+def collapse_shared_sentences(responses, threshold=None):
+    """
+    Move statements that several models make in nearly the same words out of
+    their responses. Each becomes one line, "<sentence> (stated by A, B)",
+    using the sentence closest to the rest of its group.
+
+    All candidate sentences are vectorized together and compared in one
+    cosine matrix; only pairs from different models can match, and never a
+    negated sentence with a plain one. Close pairs are then linked only when
+    their content words mostly overlap, in much the same order, and no word
+    on one side is the opposite of a word on the other, so "picks" / "selects
+    a pivot element" are shared while "Heat the oven..." and "Cool the
+    oven..." stay in their own responses. Returns (responses, shared_lines,
+    report).
+    """
+    threshold = SHARED_SENTENCE_THRESHOLD if threshold is None else threshold
+    start = time.perf_counter()
+
+    units = [split_units(r["response"]) for r in responses]
+    candidates = [
+        (owner, index, unit)
+        for owner, owner_units in enumerate(units)
+        for index, unit in enumerate(owner_units)
+        if not unit.startswith("```") and len(words(unit)) >= MIN_SENTENCE_WORDS
+    ]
+    report = {"sentences": len(candidates), "shared": 0, "removed": 0, "tokens_saved": 0, "ms": 0.0}
+
+    if len({owner for owner, _, _ in candidates}) < 2:
+        report["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return responses, [], report
+
+    # "divide-and-conquer" and "divide and conquer" should match
+    texts = [unit.replace("-", " ") for _, _, unit in candidates]
+    similarity = cosine_matrix(_vectorizer.transform(texts))
+    owners = np.array([owner for owner, _, _ in candidates])
+    negated = np.array([bool(_NEGATION.search(unit)) for _, _, unit in candidates])
+    close = (
+        np.triu(similarity >= threshold, k=1)
+        & (owners[:, None] != owners[None, :])
+        & (negated[:, None] == negated[None, :])
+    )
+    pairs = np.argwhere(close)
+    digits = {i: numbers(candidates[i][2]) for i in np.unique(pairs)}
+    content = {i: words(texts[i]) for i in np.unique(pairs)}
+    links = [
+        (i, j) for i, j in pairs
+        if digits[i] == digits[j] and _shared_statement(content[i], content[j])
+    ]
+
+    shared = []
+    removed = set()
+    for group in _clusters(links, len(candidates)):
+        members = sorted(group)
+        central = max(members, key=lambda i: similarity[i, members].sum())
+        models = []
+        for i in members:
+            model = responses[candidates[i][0]]["model"]
+            if model not in models:
+                models.append(model)
+            removed.add(candidates[i][:2])
+        shared.append(f"{candidates[central][2].strip()} (stated by {', '.join(models)})")
+
+    collapsed = []
+    for owner, (r, owner_units) in enumerate(zip(responses, units)):
+        kept = "".join(unit for index, unit in enumerate(owner_units) if (owner, index) not in removed).strip()
+        collapsed.append({**r, "response": kept or "(all of its points are listed as shared)"})
+
+    report["shared"] = len(shared)
+    report["removed"] = len(removed)
+    report["tokens_saved"] = (
+        sum(estimate_tokens(r["response"]) for r in responses)
+        - sum(estimate_tokens(r["response"]) for r in collapsed)
+        - sum(estimate_tokens(line) for line in shared)
+    )
+    report["ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return collapsed, shared, report
+
+
+class ConsensusPolicy:
+    """
+    Decides whether the model responses agree closely enough to skip the
+    synthesis call. Agreement is the mean pairwise cosine of the responses'
+    term-frequency vectors (no IDF: over a handful of responses it would
+    weight exactly the words they do not share). It only counts when every
+    response states the same numbers, the same polarity and the same content
+    words in much the same order, so "42" vs "41", "is" vs "is not",
+    "Jupiter" vs "Saturn" or "Earth orbits the Sun" vs "the Sun orbits Earth"
+    always go to synthesis.
+
+    The pick is the most central response, the one closest to all others.
+    Responses tied for it (any two, or identical answers) agree by then, so
+    the longest of them is taken, the first on a further tie. Saved latency
+    is estimated from the synthesis route's median.
+    """
+
+    def __init__(self, threshold=0.7, synthesis_route="openai/gpt-oss-20b:novita"):
+        self.threshold = threshold
+        self.synthesis_route = synthesis_route
+
+        self.evaluated = 0
+        self.fired = 0
+        self.saved_s = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(threshold=CONSENSUS_THRESHOLD)
+
+    def score(self, responses):
+        """Returns (agreement, index of the most central response)."""
+        rows = normalize(_vectorizer.transform([r["response"].replace("-", " ") for r in responses]))
+        similarity = rows @ rows.T
+        n = len(responses)
+        centrality = (similarity.sum(axis=1) - 1.0) / (n - 1)
+        tied = np.flatnonzero(centrality >= centrality.max() - 1e-6)
+        central = max(tied, key=lambda i: (len(responses[i]["response"]), -i))
+        return float(centrality.mean()), int(central)
+
+    def check(self, responses):
+        """
+        Returns (response or None, report). A response is returned when the
+        synthesis can be skipped.
+        """
+        start = time.perf_counter()
+        report = {"threshold": self.threshold, "agreement": None, "fired": False}
+
+        if len(responses) < 2 or self.threshold > 1:
+            reason = "too few responses" if len(responses) < 2 else "disabled"
+        elif len({frozenset(numbers(r["response"])) for r in responses}) > 1:
+            reason = "numbers differ"
+        elif len({bool(_NEGATION.search(r["response"])) for r in responses}) > 1:
+            reason = "polarity differs"
+        elif not self._same_wording(responses):
+            reason = "content differs"
+        else:
+            agreement, central = self.score(responses)
+            report["agreement"] = round(agreement, 3)
+            reason = None if agreement >= self.threshold else "below threshold"
+
+        with self._lock:
+            self.evaluated += 1
+            if reason is None:
+                self.fired += 1
+                saved = latency_tracker.quantile(self.synthesis_route, 0.5)
+                if saved is not None:
+                    self.saved_s += saved
+                    report["saved_s"] = round(saved, 3)
+
+        report["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        if reason is not None:
+            report["reason"] = reason
+            return None, report
+
+        pick = responses[central]
+        report["fired"] = True
+        report["model"] = pick["model"]
+        return pick, report
+
+    @staticmethod
+    def _same_wording(responses):
+        first, *rest = [wording(r["response"].replace("-", " ")) for r in responses]
+        return all(_same_statement(first, other) for other in rest)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "evaluated": self.evaluated,
+                "fired": self.fired,
+                "fire_rate": round(self.fired / self.evaluated, 3) if self.evaluated else 0.0,
+                "saved_s": round(self.saved_s, 3),
+            }
+
+
+consensus_policy = ConsensusPolicy.from_env()
@@ -0,0 +1,251 @@
+from collections import OrderedDict
+import threading
+import time
+
+import numpy as np
+
+from text_vectors import (HashingVectorizer, idf, normalize, numbers, question_words, same_order, topic_words,
+                          word_overlap)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and hit/miss counters.
+
+    Entries can carry a version; a lookup with a different version is
+    treated as stale and counted as a miss.
+    """
+
+    def __init__(self, max_entries=1024, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key, version=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, entry_version, value = entry
+            if expires_at < now or entry_version != version:
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SemanticCache:
+    """
+    Near-duplicate prompt cache backed by an in-memory TF-IDF matrix.
+
+    Each slot holds the hashed term-frequency row of a prompt's topic, its
+    content words without question and request words run together, so
+    "explain quicksort", "how does quicksort work" and "explain quick sort"
+    share one row. IDF weights come from the live document frequencies, so a
+    lookup is two matrix-vector products over the whole index (no per-entry
+    Python work). When full, the least recently used slot is evicted.
+
+    A hit needs cosine similarity >= threshold and, per candidate:
+    identical numeric tokens; the same question words when both prompts have
+    any ("when" vs "where was X born"); shared topic words in the same order
+    ("convert celsius to fahrenheit" vs its reverse); and a topic word
+    overlap of at least min_word_overlap.
+    """
+
+    REPORT_EDGES = (0.0, 0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0001)
+
+    def __init__(self, capacity=1024, threshold=0.85, ttl=3600, n_features=4096, min_word_overlap=0.5):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.min_word_overlap = min_word_overlap
+        self.ttl = ttl
+        self.vectorizer = HashingVectorizer(n_features=n_features)
+
+        self._tf = np.zeros((capacity, n_features), dtype=np.float32)
+        self._tf_sq = np.zeros((capacity, n_features), dtype=np.float32)
+        self._df = np.zeros(n_features, dtype=np.float32)
+        self._namespace = np.full(capacity, -1, dtype=np.int32)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._prompts = [None] * capacity
+        self._numbers = [None] * capacity
+        self._topics = [None] * capacity
+        self._questions = [None] * capacity
+        self._values = [None] * capacity
+        self._namespace_ids = {}
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.blocked_by_numbers = 0
+        self.blocked_by_question = 0
+        self.blocked_by_wording = 0
+        self._hit_similarity = np.zeros(len(self.REPORT_EDGES) - 1, dtype=np.int64)
+        self._miss_similarity = np.zeros(len(self.REPORT_EDGES) - 1, dtype=np.int64)
+        self._hit_similarity_sum = 0.0
+
+    def _namespace_id(self, namespace):
+        return self._namespace_ids.setdefault(namespace, len(self._namespace_ids))
+
+    def _free_slot(self, now):
+        empty = np.flatnonzero(self._namespace < 0)
+        if len(empty):
+            return int(empty[0])
+        expired = np.flatnonzero(self._expires < now)
+        slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+        self._df -= self._tf[slot] > 0
+        self.evictions += 1
+        return slot
+
+    def _vectorize(self, topics):
+        return self.vectorizer.transform(["".join(topic) for topic in topics])
+
+    def put(self, prompt, value, namespace=None):
+        topic = topic_words(prompt)
+        row = self._vectorize([topic])[0]
+        now = time.monotonic()
+        with self._lock:
+            ns = self._namespace_id(namespace)
+            matches = [i for i, p in enumerate(self._prompts) if p == prompt and self._namespace[i] == ns]
+            if matches:
+                slot = matches[0]
+                self._df -= self._tf[slot] > 0
+            else:
+                slot = self._free_slot(now)
+
+            self._tf[slot] = row
+            self._tf_sq[slot] = row * row
+            self._df += row > 0
+            self._namespace[slot] = ns
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._prompts[slot] = prompt
+            self._numbers[slot] = numbers(prompt)
+            self._topics[slot] = topic
+            self._questions[slot] = question_words(prompt)
+            self._values[slot] = value
+
+    def get_many(self, prompts, namespace=None):
+        """
+        Batch lookup. Returns one (value, similarity, cached_prompt) tuple per
+        prompt, or None where nothing is similar enough.
+        """
+        query_topics = [topic_words(p) for p in prompts]
+        queries = self._vectorize(query_topics)
+        query_numbers = [numbers(p) for p in prompts]
+        query_questions = [question_words(p) for p in prompts]
+        now = time.monotonic()
+
+        with self._lock:
+            self.lookups += len(prompts)
+            ns = self._namespace_ids.get(namespace)
+            live = (self._namespace == ns) & (self._expires >= now) if ns is not None else None
+            if live is None or not live.any():
+                self._miss_similarity[0] += len(prompts)
+                return [None] * len(prompts)
+
+            # cos(q, d) = sum(q * d * w^2) / (|q * w| * |d * w|), with |d * w|
+            # from the squared rows so the index is never copied or reweighted
+            weights = idf(self._df, int((self._namespace >= 0).sum()))
+            squared = weights * weights
+            entry_norms = np.sqrt(self._tf_sq @ squared)
+            entry_norms[entry_norms == 0] = 1.0
+            similarity = (normalize(queries * weights) * weights) @ self._tf.T / entry_norms
+            similarity[:, ~live] = -1.0
+
+            results = []
+            for row, (prompt_numbers, questions, topic) in enumerate(
+                zip(query_numbers, query_questions, query_topics)
+            ):
+                order = np.argsort(similarity[row])[::-1]
+                best = float(similarity[row, order[0]])
+                found = None
+                for slot in order:
+                    score = float(similarity[row, slot])
+                    if score < self.threshold:
+                        break
+                    if self._numbers[slot] != prompt_numbers:
+                        self.blocked_by_numbers += 1
+                        continue
+                    if questions and self._questions[slot] and questions != self._questions[slot]:
+                        self.blocked_by_question += 1
+                        continue
+                    slot_topic = self._topics[slot]
+                    if (not same_order(topic, slot_topic)
+                            or word_overlap(topic, slot_topic) < self.min_word_overlap):
+                        self.blocked_by_wording += 1
+                        continue
+                    found = (self._values[slot], score, self._prompts[slot])
+                    self._last_used[slot] = now
+                    break
+
+                if found:
+                    self.hits += 1
+                    self._hit_similarity_sum += found[1]
+                    self._hit_similarity[np.searchsorted(self.REPORT_EDGES, found[1], side="right") - 1] += 1
+                else:
+                    self._miss_similarity[np.searchsorted(self.REPORT_EDGES, max(best, 0.0), side="right") - 1] += 1
+                results.append(found)
+            return results
+
+    def get(self, prompt, namespace=None):
+        return self.get_many([prompt], namespace)[0]
+
+    def stats(self):
+        """Hit-quality report: where hits and near-misses fall by similarity."""
+        labels = [f"{lo:.2f}-{min(hi, 1.0):.2f}" for lo, hi in zip(self.REPORT_EDGES, self.REPORT_EDGES[1:])]
+        with self._lock:
+            return {
+                "size": int((self._namespace >= 0).sum()),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "evictions": self.evictions,
+                "blocked_by_numbers": self.blocked_by_numbers,
+                "blocked_by_question": self.blocked_by_question,
+                "blocked_by_wording": self.blocked_by_wording,
+                "avg_hit_similarity": round(self._hit_similarity_sum / self.hits, 4) if self.hits else None,
+                "hit_similarity": dict(zip(labels, self._hit_similarity.tolist())),
+                "miss_best_similarity": dict(zip(labels, self._miss_similarity.tolist())),
+            }
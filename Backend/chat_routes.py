@@ -1,51 +1,82 @@
 from flask import Blueprint, request, jsonify, Response, session
 from db_connection import get_db_connection
+from cache import TTLCache
+from persistence import chat_writer
+from memory_extractor import MemoryExtractor
+from coalesce import single_flight
+from sse import sse_writer
+from repetition import RepetitionFilter
+from scheduler import model_scheduler
+from ensemble import (DEFAULT_MODELS, call_model, check_consensus, fan_out, fanout_timeout, merge,
+                      parse_ensemble_options, prepare_synthesis, quorum_reached)
+from model_selection import model_selector
+from metrics import (memory_condense_seconds, memory_read_seconds, synthesis_seconds,
+                     synthesis_total, synthesis_ttft_seconds)
+from psycopg.rows import dict_row
+import tracing
+from datetime import datetime
+import engine
+import base64
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-import concurrent.futures
-import json
+import asyncio
 import time
-import re
-import threading
 
 load_dotenv()
 
 chat_routes = Blueprint('chat', __name__)
+tracing.install(chat_routes)
 
-client = OpenAI(
+client = AsyncOpenAI(
     base_url="https://router.huggingface.co/v1",
     api_key=os.environ.get("HF_TOKEN"),
 )
 
+# Long-term memory is extracted in the background, several chats per call
+memory_extractor = MemoryExtractor.from_env(client)
+
+# "blocking" loads memory before the fan-out, "parallel" loads it alongside.
+# In parallel mode MEMORY_POLICY decides whether models wait for it ("wait")
+# or start without it and memory only feeds the synthesis ("synthesis").
+MEMORY_MODE = os.getenv("MEMORY_MODE", "blocking")
+MEMORY_POLICY = os.getenv("MEMORY_POLICY", "synthesis")
+
+# Condensed memory per user, tagged with the latest chat row it was built from
+memory_cache = TTLCache(
+    max_entries=int(os.getenv("MEMORY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("MEMORY_CACHE_TTL", "1800")),
+)
+
 # ---------------- MEMORY HELPERS ---------------- #
 
 def get_recent_memory(user_id, limit=5):
-    connection = get_db_connection()
-    cursor = connection.cursor()
+    """Returns (version, raw_memory) where version identifies the newest chat row."""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
 
-    cursor.execute("""
-        SELECT user_message, model_response
-        FROM chats
-        WHERE user_id = %(user_id)s
-        ORDER BY created_at DESC
-        LIMIT %(limit)s
-    """, {"user_id": user_id, "limit": limit})
+        cursor.execute("""
+            SELECT id, created_at, user_message, model_response
+            FROM chats
+            WHERE user_id = %(user_id)s
+            ORDER BY created_at DESC
+            LIMIT %(limit)s
+        """, {"user_id": user_id, "limit": limit})
 
-    rows = cursor.fetchall()
-    cursor.close()
-    connection.close()
+        rows = cursor.fetchall()
+        cursor.close()
 
     if not rows:
-        return ""
+        return None, ""
 
-    return "\n".join(
-        f"User: {r[0]}\nAssistant: {r[1]}"
+    version = (rows[0][0], rows[0][1])
+    return version, "\n".join(
+        f"User: {r[2]}\nAssistant: {r[3]}"
         for r in reversed(rows)
     )
 
 
-def condense_memory(raw_memory):
+async def condense_memory(raw_memory, user_key):
     if not raw_memory.strip():
         return ""
 
@@ -64,26 +95,169 @@ CONVERSATION:
 {raw_memory}
 """
 
-    completion = client.chat.completions.create(
-        model="openai/gpt-oss-20b:novita",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=200,
-        timeout=60
-    )
+    start = time.perf_counter()
+    try:
+        async with model_scheduler.slot(user_key, "openai/gpt-oss-20b:novita"):
+            completion = await client.chat.completions.create(
+                model="openai/gpt-oss-20b:novita",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=200,
+                timeout=60
+            )
+    except Exception:
+        memory_condense_seconds.observe(time.perf_counter() - start, "error")
+        raise
+    memory_condense_seconds.observe(time.perf_counter() - start, "ok")
 
     return completion.choices[0].message.content.strip()
 
 
-def strip_repetition(text):
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    seen = set()
-    output = []
-    for s in sentences:
-        key = s.lower().strip()
-        if key not in seen:
-            seen.add(key)
-            output.append(s)
-    return " ".join(output)
+async def load_memory_context(user_id):
+    """Condensed memory for user_id, re-summarized only when history changed."""
+    start = time.perf_counter()
+    with tracing.span("memory_read"):
+        version, raw_memory = await asyncio.to_thread(get_recent_memory, user_id)
+    memory_read_seconds.observe(time.perf_counter() - start)
+
+    cached = memory_cache.get(user_id, version=version)
+    if cached is not None:
+        return cached
+
+    with tracing.span("condense"):
+        memory_context = await condense_memory(raw_memory, f"user:{user_id}")
+    memory_cache.put(user_id, memory_context, version=version)
+    return memory_context
+
+
+async def refresh_memory_cache(user_id):
+    """Rebuild the cached memory after a new chat row so the next message hits."""
+    memory_cache.invalidate(user_id)
+    try:
+        await load_memory_context(user_id)
+    except Exception as e:
+        print(f"[chat] Memory cache refresh error: {e}")
+
+
+def load_chat_responses(user_id, chat_id):
+    """
+    Returns (user_message, responses) for one of the user's chats, where
+    responses are the stored successful model answers, or None if the chat
+    does not exist or belongs to someone else.
+    """
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT c.user_message, r.model, r.response
+            FROM chats c
+            LEFT JOIN chat_model_responses r
+                ON r.chat_id = c.id AND r.outcome IN ('included', 'late')
+            WHERE c.id = %(chat_id)s AND c.user_id = %(user_id)s
+            ORDER BY r.id
+        """, {"chat_id": chat_id, "user_id": user_id})
+        rows = cursor.fetchall()
+        cursor.close()
+
+    if not rows:
+        return None
+    return rows[0][0], [
+        {"model": model, "response": response}
+        for _, model, response in rows if model is not None
+    ]
+
+
+def update_chat_response(user_id, chat_id, model_response):
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE chats
+            SET model_response = %(model_response)s
+            WHERE id = %(chat_id)s AND user_id = %(user_id)s
+        """, {"model_response": model_response, "chat_id": chat_id, "user_id": user_id})
+        connection.commit()
+        cursor.close()
+
+
+# ---------------- SYNTHESIS ---------------- #
+
+def build_synthesis_prompt(user_message, memory_context, included, shared=()):
+    formatted = "\n".join(
+        f"[{r['model']}]\n{r['response']}"
+        for r in included
+    )
+    if shared:
+        # Statements several models made, collapsed into one line each
+        formatted = "[Shared]\n" + "\n".join(f"- {line}" for line in shared) + "\n" + formatted
+
+    return f"""
+USER QUESTION:
+{user_message}
+
+RELEVANT USER MEMORY:
+{memory_context}
+
+MODEL RESPONSES:
+{formatted}
+
+TASK:
+Produce ONE correct, internally consistent answer using only the model responses.
+"""
+
+
+async def stream_synthesis(user_key, user_message, included, memory_context, parts):
+    """
+    Yield events for one synthesis over the included model responses: a
+    synthesis_prompt report of the token budget, then synthesis_chunk deltas
+    with repeated sentences dropped as they stream. Emitted text is also
+    appended to parts.
+    """
+    synthesis_prompt, prompt_report = await prepare_synthesis(
+        included, lambda responses, shared: build_synthesis_prompt(user_message, memory_context, responses, shared)
+    )
+    yield "synthesis_prompt", prompt_report
+
+    # Stream the synthesis token-by-token. It runs as a one-call fan-out so
+    # its deadline is enforced on the call itself, not on this consumer.
+    synthesis_call = lambda on_chunk: call_model(
+        client,
+        user_key,
+        "openai/gpt-oss-20b:novita",
+        [{"role": "user", "content": synthesis_prompt}],
+        on_chunk=on_chunk,
+        fallback="openai/gpt-oss-20b:together",
+        max_tokens=2048,
+    )
+
+    repetition_filter = RepetitionFilter()
+    received = False
+    start = time.perf_counter()
+    span = tracing.begin("synthesis", prompt_tokens=prompt_report["tokens_after"])
+    async for kind, _, value in fan_out([("GPT-OSS", synthesis_call)]):
+        if kind == "chunk":
+            if not received:
+                ttft = time.perf_counter() - start
+                synthesis_ttft_seconds.observe(ttft, "chat")
+                span.set(ttft_ms=round(ttft * 1000, 3))
+            received = True
+            text = repetition_filter.feed(value)
+            if text:
+                parts.append(text)
+                yield "synthesis_chunk", text
+        elif kind == "error":
+            span.set(error=type(value).__name__)
+            print(f"[chat] Synthesis stream error: {value}")
+            if not received:
+                yield "synthesis_chunk", "Synthesis timed out. Individual model responses are shown above."
+
+    span.end()
+    synthesis_seconds.observe(time.perf_counter() - start, "chat")
+    synthesis_total.inc("chat", "llm")
+
+    text = repetition_filter.flush()
+    if text:
+        parts.append(text)
+        yield "synthesis_chunk", text
+    if repetition_filter.dropped:
+        print(f"[chat] Dropped repeated sentences: {repetition_filter.stats()}")
 
 
 # ---------------- CHAT ROUTE ---------------- #
@@ -91,171 +265,286 @@ def strip_repetition(text):
 @chat_routes.route('/api/chat', methods=['POST'])
 def chat():
     user_id = session['user_id']
+    user_key = f"user:{user_id}"
     data = request.json
 
     user_message = f"{data.get('message', '').strip()}. English only."
-    selected_models = data.get('models', ['deepseek', 'llama', 'glm', 'essential', 'moonshot'])
+    requested_models = data.get('models', DEFAULT_MODELS)
     enable_synthesis = data.get('synthesize', True)
-    min_for_synthesis = data.get('min_for_synthesis', 2)
+    memory_mode = data.get('memory_mode', MEMORY_MODE)
+    memory_policy = data.get('memory_policy', MEMORY_POLICY)
+    try:
+        min_for_synthesis, quorum, soft_deadline, latency_budget = parse_ensemble_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     if not user_message:
         return jsonify({"error": "Empty message"}), 400
 
-    # -------- MEMORY LOAD -------- #
-    raw_memory = get_recent_memory(user_id)
-    memory_context = condense_memory(raw_memory)
+    request_start = time.time()
 
+    # -------- MEMORY LOAD -------- #
+    async def load_memory():
+        start = time.time()
+        try:
+            context = await load_memory_context(user_id)
+        except Exception as e:
+            print(f"[chat] Memory load error: {e}")
+            context = ""
+        return context, time.time() - start
+
+    blocking_memory = None
+    if memory_mode != "parallel":
+        blocking_memory = (engine.run(tracing.traced(load_memory_context(user_id))), time.time() - request_start)
+
+    # A config may set "needs_memory": True to always wait for memory, and
+    # "fallback" to another provider route tried when hf_model's circuit is open
+    # or its call fails
     model_configs = {
-        "deepseek": {"label": "DeepSeek", "hf_model": "deepseek-ai/DeepSeek-V3.2:novita"},
-        "llama": {"label": "Llama", "hf_model": "meta-llama/Llama-3.1-8B-Instruct:novita"},
+        "deepseek": {"label": "DeepSeek", "hf_model": "deepseek-ai/DeepSeek-V3.2:novita",
+                     "fallback": "deepseek-ai/DeepSeek-V3.2:together"},
+        "llama": {"label": "Llama", "hf_model": "meta-llama/Llama-3.1-8B-Instruct:novita",
+                  "fallback": "meta-llama/Llama-3.1-8B-Instruct:together"},
         "glm": {"label": "GLM", "hf_model": "zai-org/GLM-4.6:novita"},
         "essential": {"label": "Essential", "hf_model": "EssentialAI/rnj-1-instruct:together"},
-        "moonshot": {"label": "Moonshot", "hf_model": "moonshotai/Kimi-K2-Instruct:novita"},
+        "moonshot": {"label": "Moonshot", "hf_model": "moonshotai/Kimi-K2-Instruct:novita",
+                     "fallback": "moonshotai/Kimi-K2-Instruct:together"},
     }
 
-    def invoke_model(cfg):
-        completion = client.chat.completions.create(
-            model=cfg["hf_model"],
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"Relevant user context:\n{memory_context}" if memory_context else "No prior context."
-                },
-                {"role": "user", "content": user_message}
-            ],
-            timeout=90,
-        )
-
-        return {
+    selection = None
+    if requested_models == "auto":
+        with tracing.span("selection"):
+            selected_models, selection = model_selector.select(
+                model_configs,
+                budget_s=latency_budget,
+                min_models=max(model_selector.min_models, min_for_synthesis if enable_synthesis else 0),
+            )
+    elif requested_models == "all":
+        selected_models = list(model_configs)
+    else:
+        selected_models = requested_models
+
+    async def invoke_model(cfg, get_memory, on_chunk):
+        if memory_mode != "parallel" or memory_policy == "wait" or cfg.get("needs_memory"):
+            memory_context, _ = await get_memory()
+        else:
+            memory_context = ""
+
+        with tracing.span("model", model=cfg["label"]):
+            response, elapsed, route = await call_model(
+                client,
+                user_key,
+                cfg["hf_model"],
+                [
+                    {
+                        "role": "system",
+                        "content": f"Relevant user context:\n{memory_context}" if memory_context else "No prior context."
+                    },
+                    {"role": "user", "content": user_message}
+                ],
+                on_chunk=on_chunk,
+                fallback=cfg.get("fallback"),
+            )
+
+        result = {
             "model": cfg["label"],
-            "response": completion.choices[0].message.content,
-            "success": True
+            "response": response,
+            "success": True,
+            "elapsed": elapsed,
+        }
+        if route != cfg["hf_model"]:
+            result["route"] = route
+        return result
+
+    # Per-model outcome (included / late / error / unfinished), stored with the chat row
+    outcomes = {}
+    synthesis_response = None
+
+    def record_outcome(label, outcome, value=None, error=None):
+        cfg = next(c for c in model_configs.values() if c["label"] == label)
+        outcomes[label] = {
+            "model": label,
+            "route": value.get("route", cfg["hf_model"]) if value else cfg["hf_model"],
+            "response": value["response"] if value else None,
+            "outcome": outcome,
+            "error": str(error) if error is not None else None,
+            "latency_ms": round(value["elapsed"] * 1000) if value else None,
         }
 
-    def generate():
+    async def late_responses(fan):
+        # Models that finish after synthesis started still reach the client
+        async for kind, label, value in fan:
+            if kind == "chunk":
+                yield "model_chunk", {"model": label, "delta": value}
+            elif kind == "result":
+                record_outcome(label, "late", value)
+                late = {**value, "excluded_from_synthesis": True}
+                yield "model_response", late
+            elif kind == "error":
+                record_outcome(label, "error", error=value)
+                print(f"[chat] Model future error: {value}")
+
+    async def synthesize(included, memory_context):
+        nonlocal synthesis_response
+        done = {"models": [r["model"] for r in included]}
+
+        # Models that all said the same thing need no synthesis call; the
+        # most representative response is sent as the synthesis instead
+        pick, consensus = check_consensus(included)
+        if pick is not None:
+            print(f"[chat] Consensus, synthesis skipped: {consensus}")
+            synthesis_total.inc("chat", "consensus")
+            synthesis_response = pick["response"]
+            yield "synthesis_chunk", synthesis_response
+            yield "synthesis_done", {**done, "synthesis_source": "consensus", "consensus": consensus}
+            return
+
+        parts = []
+        async for event in stream_synthesis(user_key, user_message, included, memory_context, parts):
+            yield event
+
+        synthesis_response = "".join(parts)
+
+        # Signal synthesis is complete
+        yield "synthesis_done", {**done, "synthesis_source": "llm", "consensus": consensus}
+
+    # -------- MEMORY WRITE-BACK (background) -------- #
+    async def save_chat(synthesis_response, model_responses):
+        row = {
+            "user_id": user_id,
+            "user_message": user_message,
+            "model_response": synthesis_response,
+            "memory_summary": None,
+            "model_responses": model_responses,
+        }
+        # Batched by the write-behind worker; resolves once the row is committed
+        try:
+            chat_id = await chat_writer.save(row)
+        except Exception as db_err:
+            print(f"[chat] DB save error: {db_err}")
+            return
+        # memory_summary is filled in later by the batched extractor
+        memory_extractor.submit(chat_id, user_message, synthesis_response)
+        await refresh_memory_cache(user_id)
+
+    trace = tracing.current()
+
+    async def generate():
+        tracing.activate(trace)
         results = []
+        finished = 0
+        deadline_passed = False
+        ttfb = None
+        first_call = 0.0
+
+        if selection is not None:
+            yield "model_selection", selection
+
+        memory_task = None if blocking_memory else asyncio.create_task(load_memory())
+
+        async def get_memory():
+            if memory_task is None:
+                return blocking_memory
+            # Shielded: a cancelled model call must not cancel the shared load
+            return await asyncio.shield(memory_task)
+
+        calls = [
+            (model_configs[m]["label"], lambda on_chunk, cfg=model_configs[m]: invoke_model(cfg, get_memory, on_chunk))
+            for m in selected_models if m in model_configs
+        ]
+
+        timeout = fanout_timeout(model_configs[m]["hf_model"] for m in selected_models if m in model_configs)
+        fan = fan_out(calls, timeout=timeout, soft_deadline=soft_deadline)
+        try:
+            async for kind, label, value in fan:
+                if kind == "chunk":
+                    yield "model_chunk", {"model": label, "delta": value}
+                    continue
+
+                if kind == "result":
+                    finished += 1
+                    results.append(value)
+                    record_outcome(label, "included", value)
+                    if ttfb is None:
+                        ttfb = time.time() - request_start
+                        first_call = value["elapsed"]
+                    yield "model_response", value
+                elif kind == "error":
+                    finished += 1
+                    record_outcome(label, "error", error=value)
+                    print(f"[chat] Model future error: {value}")
+                elif kind == "deadline":
+                    deadline_passed = True
+                else:
+                    print("[chat] Fan-out timed out, continuing with completed models")
+                    break
+
+                if enable_synthesis and quorum_reached(
+                    len(results), finished, len(calls), quorum, min_for_synthesis, deadline_passed
+                ):
+                    break
+
+            memory_context, memory_elapsed = await get_memory()
+
+            # Blocking TTFB would have been memory load + the first model's own call
+            ttfb_saved = 0.0
+            if memory_mode == "parallel" and ttfb is not None:
+                ttfb_saved = max(0.0, memory_elapsed + first_call - ttfb)
+            timing = {
+                "mode": memory_mode,
+                "policy": memory_policy,
+                "memory_s": round(memory_elapsed, 3),
+                "ttfb_s": round(ttfb, 3) if ttfb is not None else None,
+                "ttfb_saved_s": round(ttfb_saved, 3),
+            }
+            print(f"[chat] Memory timing: {timing}")
+            yield "memory_timing", timing
+
+            if enable_synthesis and len(results) >= min_for_synthesis:
+                async for event in merge(late_responses(fan), synthesize(list(results), memory_context)):
+                    yield event
+            else:
+                async for event in late_responses(fan):
+                    yield event
+        finally:
+            await fan.aclose()
+            if synthesis_response is not None:
+                for m in selected_models:
+                    if m in model_configs and model_configs[m]["label"] not in outcomes:
+                        record_outcome(model_configs[m]["label"], "unfinished")
+                engine.create_background_task(save_chat(synthesis_response, list(outcomes.values())))
+
+        yield "timing", trace.finish()
+        yield "done", None
+
+    # A double-submitted message joins the stream already running for it
+    flight_key = (
+        "chat", user_id, user_message, tuple(selected_models), bool(enable_synthesis),
+        min_for_synthesis, memory_mode, memory_policy, quorum, soft_deadline,
+    )
+    upstream_calls = sum(1 for m in selected_models if m in model_configs) + (1 if enable_synthesis else 0)
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [
-                executor.submit(invoke_model, model_configs[m])
-                for m in selected_models if m in model_configs
-            ]
-
-            for f in concurrent.futures.as_completed(futures, timeout=120):
-                try:
-                    r = f.result(timeout=90)
-                    results.append(r)
-                    yield f"data: {json.dumps({'type': 'model_response', 'data': r})}\n\n"
-                except Exception as e:
-                    print(f"[chat] Model future error: {e}")
-
-        if enable_synthesis and len(results) >= min_for_synthesis:
-            formatted = "\n".join(
-                f"[{r['model']}]\n{r['response']}"
-                for r in results
-            )
-
-            synthesis_prompt = f"""
-USER QUESTION:
-{user_message}
-
-RELEVANT USER MEMORY:
-{memory_context}
-
-MODEL RESPONSES:
-{formatted}
-
-TASK:
-Produce ONE correct, internally consistent answer using only the model responses.
-"""
-
-            # Stream the synthesis token-by-token
-            synthesis_chunks = []
-            try:
-                stream = client.chat.completions.create(
-                    model="openai/gpt-oss-20b:novita",
-                    messages=[{"role": "user", "content": synthesis_prompt}],
-                    max_tokens=2048,
-                    timeout=90,
-                    stream=True,
-                )
-
-                for chunk in stream:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        synthesis_chunks.append(delta.content)
-                        yield f"data: {json.dumps({'type': 'synthesis_chunk', 'data': delta.content})}\n\n"
-
-            except Exception as e:
-                print(f"[chat] Synthesis stream error: {e}")
-                if not synthesis_chunks:
-                    yield f"data: {json.dumps({'type': 'synthesis_chunk', 'data': 'Synthesis timed out. Individual model responses are shown above.'})}\n\n"
-
-            synthesis_response = strip_repetition("".join(synthesis_chunks))
-
-            # Signal synthesis is complete
-            yield f"data: {json.dumps({'type': 'synthesis_done'})}\n\n"
+    return Response(
+        engine.stream(sse_writer.stream(single_flight.stream(flight_key, generate, upstream_calls))),
+        mimetype='text/event-stream',
+    )
 
-            # -------- MEMORY WRITE-BACK (background) -------- #
-            def _save_memory():
-                try:
-                    memory_prompt = f"""
-Extract long-term memory from this exchange.
-Return NONE if nothing stable.
 
-User: {user_message}
-Assistant: {synthesis_response}
-"""
-                    memory_result = client.chat.completions.create(
-                        model="openai/gpt-oss-20b:novita",
-                        messages=[{"role": "user", "content": memory_prompt}],
-                        max_tokens=150,
-                        timeout=30,
-                    )
-
-                    new_memory = memory_result.choices[0].message.content.strip()
-
-                    connection = get_db_connection()
-                    cursor = connection.cursor()
-                    cursor.execute("""
-                        INSERT INTO chats (user_id, user_message, model_response, memory_summary)
-                        VALUES (%s, %s, %s, %s)
-                    """, (
-                        user_id,
-                        user_message,
-                        synthesis_response,
-                        None if new_memory.upper() == "NONE" else new_memory,
-                    ))
-                    connection.commit()
-                    cursor.close()
-                    connection.close()
-                except Exception as e:
-                    print(f"[chat] Background memory save error: {e}")
-                    # Still save the chat even if memory extraction fails
-                    try:
-                        connection = get_db_connection()
-                        cursor = connection.cursor()
-                        cursor.execute("""
-                            INSERT INTO chats (user_id, user_message, model_response)
-                            VALUES (%s, %s, %s)
-                        """, (user_id, user_message, synthesis_response))
-                        connection.commit()
-                        cursor.close()
-                        connection.close()
-                    except Exception as db_err:
-                        print(f"[chat] Fallback DB save error: {db_err}")
-
-            threading.Thread(target=_save_memory, daemon=True).start()
-
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
-
-    return Response(generate(), mimetype='text/event-stream')
+# ---------------- HISTORY ROUTES ---------------- #
 
+def parse_chat_id(value):
+    """Row id from a chat id, as stored (123) or as the frontend sends it ("chat-123")."""
+    text = str(value or "")
+    text = text[len("chat-"):] if text.startswith("chat-") else text
+    return int(text) if text.isdigit() else None
 
-# ---------------- HISTORY ROUTES ---------------- #
 
 @chat_routes.route('/api/chats/save', methods=['POST'])
 def update_chat_name():
+    """
+    Rename one chat. Only a change stamps the row, so the save sent after
+    every message does not bump the user's sync version.
+    """
     if 'user_id' not in session:
         return jsonify({"error": "Not authenticated"}), 401
 
@@ -266,42 +555,315 @@ def update_chat_name():
     if not chat_name:
         return jsonify({"error": "Missing chat_name"}), 400
 
-    connection = get_db_connection()
-    cursor = connection.cursor()
+    chat_id = parse_chat_id(data.get("chat_id"))
+    if chat_id is None:
+        return jsonify({"error": "Missing or invalid chat_id"}), 400
+
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+
+        cursor.execute("""
+            UPDATE chats
+            SET chat_name = %(chat_name)s
+            WHERE id = %(chat_id)s AND user_id = %(user_id)s
+              AND chat_name IS DISTINCT FROM %(chat_name)s
+        """, {
+            "chat_name": chat_name,
+            "chat_id": chat_id,
+            "user_id": user_id
+        })
+        renamed = cursor.rowcount
+
+        connection.commit()
+        cursor.close()
+
+    return jsonify({"success": True, "chat_name": chat_name, "renamed": bool(renamed)})
+
+
+def encode_cursor(created_at, chat_id):
+    raw = f"{created_at.isoformat()}|{chat_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from an opaque cursor; raises ValueError if malformed."""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    created_at, chat_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(created_at), int(chat_id)
+
+
+def list_chats(user_id, limit, before=None, compact=False):
+    """
+    One page of a user's chats, newest first, via keyset pagination on
+    (created_at, id). Returns (rows, next_cursor).
+    """
+    if compact:
+        columns = """id, COALESCE(chat_name, LEFT(user_message, 60)) AS title,
+                     LEFT(model_response, 160) AS preview, created_at"""
+    else:
+        columns = "id, chat_name, user_message, model_response, created_at"
+
+    params = {"user_id": user_id, "limit": limit + 1}
+    keyset = ""
+    if before is not None:
+        keyset = "AND (created_at, id) < (%(created_at)s, %(id)s)"
+        params["created_at"], params["id"] = before
+
+    with get_db_connection() as connection:
+        cursor = connection.cursor(row_factory=dict_row)
+        cursor.execute(f"""
+            SELECT {columns}
+            FROM chats
+            WHERE user_id = %(user_id)s {keyset}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %(limit)s
+        """, params)
+        rows = cursor.fetchall()
+        cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat()
+    return rows, next_cursor
+
 
-    cursor.execute("""
-        UPDATE chats
-        SET chat_name = %(chat_name)s
-        WHERE user_id = %(user_id)s
-    """, {
-        "chat_name": chat_name,
-        "user_id": user_id
+@chat_routes.route('/api/chats', methods=['GET'])
+def chat_history():
+    """
+    Paginated history. Query params: limit (1-100, default 50), cursor (from
+    next_cursor of the previous page), view=compact for titles/previews only.
+    """
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    user_id = session['user_id']
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 100)
+    compact = request.args.get('view') == 'compact'
+
+    before = None
+    if request.args.get('cursor'):
+        try:
+            before = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    chats, next_cursor = list_chats(user_id, limit, before, compact)
+    return jsonify({"success": True, "chats": chats, "next_cursor": next_cursor})
+
+
+def get_sync_version(user_id):
+    """The user's chat history version; 0 if their chats never changed."""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT version FROM chat_sync_versions WHERE user_id = %(user_id)s
+        """, {"user_id": user_id})
+        row = cursor.fetchone()
+        cursor.close()
+    return row[0] if row else 0
+
+
+def list_chat_changes(user_id, since, limit, compact=False):
+    """
+    Chats created or changed and ids deleted after version since, oldest
+    change first. Returns (changed, deleted, version, has_more) where
+    version is the cursor to pass as since next time.
+    """
+    if compact:
+        columns = """id, COALESCE(chat_name, LEFT(user_message, 60)) AS title,
+                     LEFT(model_response, 160) AS preview, created_at, sync_version"""
+    else:
+        columns = "id, chat_name, user_message, model_response, created_at, sync_version"
+
+    params = {"user_id": user_id, "since": since, "limit": limit + 1}
+    with get_db_connection() as connection:
+        cursor = connection.cursor(row_factory=dict_row)
+        cursor.execute(f"""
+            SELECT {columns}
+            FROM chats
+            WHERE user_id = %(user_id)s AND sync_version > %(since)s
+            ORDER BY sync_version
+            LIMIT %(limit)s
+        """, params)
+        changed = cursor.fetchall()
+        cursor.execute("""
+            SELECT chat_id AS id, sync_version
+            FROM chat_tombstones
+            WHERE user_id = %(user_id)s AND sync_version > %(since)s
+            ORDER BY sync_version
+            LIMIT %(limit)s
+        """, params)
+        deleted = cursor.fetchall()
+        cursor.close()
+
+    # Both lists are ordered by version; keep the oldest limit changes overall
+    page = sorted(changed + deleted, key=lambda row: row["sync_version"])
+    has_more = len(page) > limit
+    page = page[:limit]
+    cutoff = page[-1]["sync_version"] if page else since
+
+    changed = [row for row in changed if row["sync_version"] <= cutoff]
+    for row in changed:
+        row["created_at"] = row["created_at"].isoformat()
+    deleted = [row["id"] for row in deleted if row["sync_version"] <= cutoff]
+    return changed, deleted, cutoff, has_more
+
+
+@chat_routes.route('/api/chats/sync', methods=['GET'])
+def sync_chats():
+    """
+    Incremental history sync. Query params: since (the version from the
+    previous sync; omit for everything), limit (1-500, default 200),
+    view=compact. Also answers If-None-Match with 304 when the user's
+    history version is unchanged.
+    """
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    user_id = session['user_id']
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 500)
+    compact = request.args.get('view') == 'compact'
+    since = request.args.get('since', type=int)
+
+    version = get_sync_version(user_id)
+    etag = f"chats-{version}"
+    if request.if_none_match.contains_weak(etag) or since == version:
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    # Versions start at 1; db_schema numbers rows from before the sync columns
+    changed, deleted, cursor, has_more = list_chat_changes(
+        user_id, 0 if since is None else since, limit, compact
+    )
+    if not (changed or deleted):
+        # Nothing after since: hand back the server's version, never a
+        # since that is ahead of it (e.g. a cursor from before a restore)
+        cursor = version
+    response = jsonify({
+        "success": True,
+        "version": cursor,
+        "has_more": has_more,
+        "full": since is None,
+        "changed": changed,
+        "deleted": deleted,
     })
+    # Only a complete page describes the current version
+    if not has_more:
+        response.set_etag(f"chats-{cursor}", weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
-    connection.commit()
-    cursor.close()
-    connection.close()
 
-    return jsonify({"success": True, "chat_name": chat_name})
+@chat_routes.route('/api/chats/<int:chat_id>', methods=['DELETE'])
+def delete_chat(chat_id):
+    """Delete one chat; the tombstone lets /api/chats/sync report it."""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
 
+    user_id = session['user_id']
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            DELETE FROM chats
+            WHERE id = %(chat_id)s AND user_id = %(user_id)s
+        """, {"chat_id": chat_id, "user_id": user_id})
+        deleted = cursor.rowcount
+        connection.commit()
+        cursor.close()
+
+    if not deleted:
+        return jsonify({"error": "Chat not found"}), 404
+
+    memory_cache.invalidate(user_id)
+    return jsonify({"success": True})
+
+
+@chat_routes.route('/api/chats/<int:chat_id>', methods=['GET'])
+def get_chat(chat_id):
+    """Full body of one chat, including each model's stored response."""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    user_id = session['user_id']
+    with get_db_connection() as connection:
+        cursor = connection.cursor(row_factory=dict_row)
+        cursor.execute("""
+            SELECT id, chat_name, user_message, model_response, created_at
+            FROM chats
+            WHERE id = %(chat_id)s AND user_id = %(user_id)s
+        """, {"chat_id": chat_id, "user_id": user_id})
+        chat = cursor.fetchone()
+
+        if chat is not None:
+            cursor.execute("""
+                SELECT model, route, response, outcome, error, latency_ms
+                FROM chat_model_responses
+                WHERE chat_id = %(chat_id)s
+                ORDER BY id
+            """, {"chat_id": chat_id})
+            chat["model_responses"] = cursor.fetchall()
+        cursor.close()
+
+    if chat is None:
+        return jsonify({"error": "Chat not found"}), 404
+
+    chat["created_at"] = chat["created_at"].isoformat()
+    return jsonify({"success": True, "chat": chat})
+
+
+@chat_routes.route('/api/chats/<int:chat_id>/resynthesize', methods=['POST'])
+def resynthesize(chat_id):
+    """Re-run only the synthesis over a chat's stored model responses (SSE)."""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not authenticated"}), 401
 
-@chat_routes.route('/api/chats', methods=['GET'])
-def chat_history():
     user_id = session['user_id']
-    connection = get_db_connection()
-    cursor = connection.cursor()
+    user_key = f"user:{user_id}"
+
+    stored = load_chat_responses(user_id, chat_id)
+    if stored is None:
+        return jsonify({"error": "Chat not found"}), 404
+
+    user_message, included = stored
+    if not included:
+        return jsonify({"error": "No stored model responses for this chat"}), 409
+
+    trace = tracing.current()
 
-    cursor.execute("""
-        SELECT id, user_message, model_response, created_at
-        FROM chats
-        WHERE user_id = %s
-        ORDER BY created_at DESC
-        LIMIT 50
-    """, (user_id,))
+    async def generate():
+        tracing.activate(trace)
+        try:
+            memory_context = await load_memory_context(user_id)
+        except Exception as e:
+            print(f"[chat] Memory load error: {e}")
+            memory_context = ""
 
-    chats = cursor.fetchall()
-    cursor.close()
-    connection.close()
+        parts = []
+        async for event in stream_synthesis(user_key, user_message, included, memory_context, parts):
+            yield event
 
-    return jsonify({"success": True, "chats": chats})
+        synthesis_response = "".join(parts)
+        done = {"models": [r["model"] for r in included], "chat_id": chat_id, "resynthesized": True,
+                "synthesis_source": "llm"}
+        yield "synthesis_done", done
 
+        if parts:
+            try:
+                await asyncio.to_thread(update_chat_response, user_id, chat_id, synthesis_response)
+                memory_cache.invalidate(user_id)
+            except Exception as e:
+                print(f"[chat] Resynthesis save error: {e}")
+
+        yield "timing", trace.finish()
+        yield "done", None
+
+    return Response(
+        engine.stream(sse_writer.stream(single_flight.stream(("resynthesize", user_id, chat_id), generate, 1))),
+        mimetype='text/event-stream',
+    )
@@ -0,0 +1,155 @@
+from collections import deque
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+load_dotenv()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Closed -> open when, over the last `window` calls (at least min_calls),
+    the error rate or the slow-call rate reaches its threshold. After
+    cooldown_s one probe call is let through (half-open); its outcome closes
+    or re-opens the circuit.
+    """
+
+    def __init__(self, window=20, min_calls=5, error_rate=0.5, slow_call_s=45.0,
+                 slow_rate=0.5, cooldown_s=30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_s = slow_call_s
+        self.slow_rate = slow_rate
+        self.cooldown_s = cooldown_s
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)  # (ok, slow)
+        self._probe_in_flight = False
+
+    def allow(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown_s:
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def success(self, latency):
+        slow = latency > self.slow_call_s
+        if self.state == HALF_OPEN:
+            if slow:
+                self._open()
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append((True, slow))
+        self._evaluate()
+
+    def failure(self):
+        if self.state == HALF_OPEN:
+            self._open()
+            return
+        self._outcomes.append((False, False))
+        self._evaluate()
+
+    def abandon(self):
+        # A cancelled probe tells us nothing; let the next call probe instead
+        self._probe_in_flight = False
+
+    def _evaluate(self):
+        if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        total = len(self._outcomes)
+        errors = sum(1 for ok, _ in self._outcomes if not ok)
+        slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+        if errors / total >= self.error_rate or slow / total >= self.slow_rate:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+        self._probe_in_flight = False
+
+    def snapshot(self):
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            "window_calls": total,
+            "error_rate": round(sum(1 for ok, _ in self._outcomes if not ok) / total, 3) if total else 0.0,
+            "slow_rate": round(sum(1 for _, slow in self._outcomes if slow) / total, 3) if total else 0.0,
+            "times_opened": self.times_opened,
+            "retry_in_s": round(max(0.0, self.opened_at + self.cooldown_s - time.monotonic()), 1)
+            if self.state == OPEN else 0.0,
+        }
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per hf_model route (model + provider suffix)."""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            window=int(os.getenv("BREAKER_WINDOW", "20")),
+            min_calls=int(os.getenv("BREAKER_MIN_CALLS", "5")),
+            error_rate=float(os.getenv("BREAKER_ERROR_RATE", "0.5")),
+            slow_call_s=float(os.getenv("BREAKER_SLOW_CALL_S", "45")),
+            slow_rate=float(os.getenv("BREAKER_SLOW_RATE", "0.5")),
+            cooldown_s=float(os.getenv("BREAKER_COOLDOWN_S", "30")),
+        )
+
+    def _get(self, hf_model):
+        if hf_model not in self._breakers:
+            self._breakers[hf_model] = CircuitBreaker(**self.settings)
+        return self._breakers[hf_model]
+
+    def allow(self, hf_model):
+        with self._lock:
+            return self._get(hf_model).allow()
+
+    def success(self, hf_model, latency):
+        with self._lock:
+            self._get(hf_model).success(latency)
+
+    def failure(self, hf_model):
+        with self._lock:
+            self._get(hf_model).failure()
+
+    def abandon(self, hf_model):
+        with self._lock:
+            self._get(hf_model).abandon()
+
+    def state(self, hf_model):
+        with self._lock:
+            breaker = self._breakers.get(hf_model)
+            return breaker.state if breaker else CLOSED
+
+    def snapshot(self):
+        with self._lock:
+            return {hf_model: b.snapshot() for hf_model, b in sorted(self._breakers.items())}
+
+
+breakers = BreakerRegistry.from_env()
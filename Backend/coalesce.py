@@ -0,0 +1,105 @@
+import asyncio
+
+
+class _Flight:
+    __slots__ = ("frames", "finished", "error", "changed", "subscribers", "task", "upstream_calls")
+
+    def __init__(self, upstream_calls):
+        self.frames = []
+        self.finished = False
+        self.error = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task = None
+        self.upstream_calls = upstream_calls
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight SSE streams. The first request for a key
+    starts the real stream (the leader); concurrent requests with the same key
+    subscribe to it and receive every frame from the beginning, including
+    those sent before they joined. The stream keeps running while anyone is
+    subscribed and is cancelled when the last subscriber disconnects.
+    Runs entirely on the engine loop.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+        self.upstream_calls_saved = 0
+        self.frames_replayed = 0
+
+    def _start(self, key, make_stream, upstream_calls):
+        flight = _Flight(upstream_calls)
+
+        async def produce():
+            source = make_stream()
+            try:
+                async for frame in source:
+                    flight.frames.append(frame)
+                    flight.notify()
+            except Exception as e:
+                flight.error = e
+            finally:
+                flight.finished = True
+                flight.notify()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                await source.aclose()
+
+        flight.task = asyncio.create_task(produce())
+        self._flights[key] = flight
+        self.leaders += 1
+        return flight
+
+    async def stream(self, key, make_stream, upstream_calls=0):
+        """
+        Yield the frames of make_stream() (an async generator function),
+        sharing one run among concurrent callers with the same key.
+        upstream_calls is the number of model calls one run makes, used for
+        the saved-calls metric.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._start(key, make_stream, upstream_calls)
+        else:
+            self.followers += 1
+            self.upstream_calls_saved += flight.upstream_calls
+            self.frames_replayed += len(flight.frames)
+
+        flight.subscribers += 1
+        sent = 0
+        try:
+            while True:
+                while sent < len(flight.frames):
+                    yield flight.frames[sent]
+                    sent += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.finished:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "upstream_calls_saved": self.upstream_calls_saved,
+            "frames_replayed_on_join": self.frames_replayed,
+        }
+
+
+single_flight = SingleFlight()
@@ -1,14 +1,93 @@
 import psycopg
+from psycopg_pool import ConnectionPool
+from contextlib import contextmanager
 from dotenv import load_dotenv
+import tracing
+import atexit
 import os
+import threading
+import time
 
 load_dotenv()
 
+# Pool sizing (override via env)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_checkout_stats = {"checkouts": 0, "total_wait_s": 0.0, "max_wait_s": 0.0, "in_use": 0}
+
+
+def get_pool():
+    """Process-wide pool, opened lazily on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                conninfo = psycopg.conninfo.make_conninfo(
+                    host=os.getenv("DB_HOST"),
+                    dbname=os.getenv("DB_NAME"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD")
+                )
+                _pool = ConnectionPool(
+                    conninfo,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    # Health check on checkout: broken connections are discarded
+                    check=ConnectionPool.check_connection,
+                    name="threadwork",
+                    open=True,
+                )
+                atexit.register(_pool.close)
+    return _pool
+
+
+@contextmanager
 def get_db_connection():
-    return psycopg.connect(
-        host=os.getenv("DB_HOST"),
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD")
-    )
+    """
+    Borrow a connection from the pool. Commits on clean exit, rolls back on
+    error, and always returns the connection to the pool.
+    """
+    start = time.perf_counter()
+    with tracing.span("db") as span, get_pool().connection() as connection:
+        waited = time.perf_counter() - start
+        span.set(pool_wait_ms=round(waited * 1000, 3))
+        with _stats_lock:
+            _checkout_stats["checkouts"] += 1
+            _checkout_stats["total_wait_s"] += waited
+            _checkout_stats["max_wait_s"] = max(_checkout_stats["max_wait_s"], waited)
+            _checkout_stats["in_use"] += 1
+        try:
+            yield connection
+        finally:
+            with _stats_lock:
+                _checkout_stats["in_use"] -= 1
+
+
+def pool_stats():
+    if _pool is None:
+        return {"open": False}
 
+    stats = _pool.get_stats()
+    with _stats_lock:
+        checkouts = _checkout_stats["checkouts"]
+        return {
+            "open": True,
+            "min_size": DB_POOL_MIN,
+            "max_size": DB_POOL_MAX,
+            "size": stats.get("pool_size", 0),
+            "available": stats.get("pool_available", 0),
+            "in_use": _checkout_stats["in_use"],
+            "waiters": stats.get("requests_waiting", 0),
+            "checkouts": checkouts,
+            "avg_checkout_ms": round(_checkout_stats["total_wait_s"] * 1000 / checkouts, 3) if checkouts else 0.0,
+            "max_checkout_ms": round(_checkout_stats["max_wait_s"] * 1000, 3),
+            "timeouts": stats.get("requests_errors", 0),
+            "connections_lost": stats.get("connections_lost", 0),
+        }
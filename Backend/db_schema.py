@@ -0,0 +1,125 @@
+from db_connection import get_db_connection
+
+# Tables and indexes owned by the backend. Every statement is idempotent so
+# ensure_schema() can run on each deploy or startup; it is run explicitly
+# (python db_schema.py, flask --app main init-db), never on import.
+SCHEMA = [
+    # Each ensemble model's answer for a saved chat row
+    """
+    CREATE TABLE IF NOT EXISTS chat_model_responses (
+        id BIGSERIAL PRIMARY KEY,
+        chat_id BIGINT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+        model TEXT NOT NULL,
+        route TEXT,
+        response TEXT,
+        outcome TEXT NOT NULL,
+        error TEXT,
+        latency_ms INTEGER,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS chat_model_responses_chat_id_idx ON chat_model_responses (chat_id)",
+    # Keyset pagination of /api/chats: a page is an index range scan in
+    # order with no sort, then one heap fetch per returned row for the
+    # title and preview. Not covering; message text is too large to index.
+    "CREATE INDEX IF NOT EXISTS chats_user_created_id_idx ON chats (user_id, created_at DESC, id DESC)",
+    # Incremental sync of /api/chats/sync. Every insert, rename, response
+    # change or delete of a chat bumps its owner's version counter and stamps
+    # the row (or its tombstone) with the new value.
+    """
+    CREATE TABLE IF NOT EXISTS chat_sync_versions (
+        user_id BIGINT PRIMARY KEY,
+        version BIGINT NOT NULL
+    )
+    """,
+    "ALTER TABLE chats ADD COLUMN IF NOT EXISTS sync_version BIGINT NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS chats_user_sync_version_idx ON chats (user_id, sync_version)",
+    # Rows from before the sync columns get distinct versions, oldest first,
+    # and their owners' counters start above them; otherwise they all share
+    # version 0 and a first sync paged by version could skip some for good.
+    # A no-op once no row is left at 0.
+    """
+    WITH numbered AS (
+        SELECT c.id,
+               COALESCE(v.version, 0)
+                   + row_number() OVER (PARTITION BY c.user_id ORDER BY c.created_at, c.id) AS version
+        FROM chats c
+        LEFT JOIN chat_sync_versions v ON v.user_id = c.user_id
+        WHERE c.sync_version = 0
+    ), stamped AS (
+        UPDATE chats SET sync_version = numbered.version
+        FROM numbered
+        WHERE chats.id = numbered.id
+        RETURNING chats.user_id, chats.sync_version
+    )
+    INSERT INTO chat_sync_versions (user_id, version)
+    SELECT user_id, max(sync_version) FROM stamped GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET version = GREATEST(chat_sync_versions.version, EXCLUDED.version)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_tombstones (
+        chat_id BIGINT PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        sync_version BIGINT NOT NULL,
+        deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS chat_tombstones_user_sync_version_idx ON chat_tombstones (user_id, sync_version)",
+    """
+    CREATE OR REPLACE FUNCTION bump_chat_sync_version(uid BIGINT) RETURNS BIGINT AS $$
+        INSERT INTO chat_sync_versions (user_id, version) VALUES (uid, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = chat_sync_versions.version + 1
+        RETURNING version
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION chats_stamp_sync_version() RETURNS trigger AS $$
+    BEGIN
+        NEW.sync_version := bump_chat_sync_version(NEW.user_id);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION chats_record_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO chat_tombstones (chat_id, user_id, sync_version)
+        VALUES (OLD.id, OLD.user_id, bump_chat_sync_version(OLD.user_id))
+        ON CONFLICT (chat_id) DO NOTHING;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER chats_sync_insert
+    BEFORE INSERT ON chats
+    FOR EACH ROW EXECUTE FUNCTION chats_stamp_sync_version()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER chats_sync_update
+    BEFORE UPDATE OF chat_name, model_response ON chats
+    FOR EACH ROW
+    WHEN (OLD.chat_name IS DISTINCT FROM NEW.chat_name
+          OR OLD.model_response IS DISTINCT FROM NEW.model_response)
+    EXECUTE FUNCTION chats_stamp_sync_version()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER chats_sync_delete
+    AFTER DELETE ON chats
+    FOR EACH ROW EXECUTE FUNCTION chats_record_tombstone()
+    """,
+]
+
+
+def ensure_schema():
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        connection.commit()
+        cursor.close()
+
+
+if __name__ == "__main__":
+    ensure_schema()
+    print("[db_schema] Schema is up to date")
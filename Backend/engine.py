@@ -0,0 +1,83 @@
+import asyncio
+import queue
+import threading
+
+# Single long-lived event loop that runs every model call, fan-out and
+# synthesis as coroutines. Flask views stay synchronous and bridge into it.
+
+_loop = None
+_loop_lock = threading.Lock()
+_background = set()
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def get_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="ensemble-engine", daemon=True
+                ).start()
+                _loop = loop
+    return _loop
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the engine loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def create_background_task(coro):
+    """create_task() from inside the loop, keeping a reference until it finishes."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+def call(fn, *args, timeout=None):
+    """
+    Run a plain function on the engine loop and return its result, for
+    reading state that only the loop mutates (e.g. scheduler stats).
+    """
+    async def run_on_loop():
+        return fn(*args)
+
+    return run(run_on_loop(), timeout)
+
+
+def stream(agen):
+    """
+    Drive an async generator on the engine loop and yield its items to the
+    calling (WSGI) thread. Closing the sync generator cancels the producer.
+    """
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except Exception as e:
+            items.put(_Failure(e))
+        finally:
+            items.put(_DONE)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_loop())
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        future.cancel()
@@ -0,0 +1,285 @@
+from scheduler import model_scheduler
+from latency import latency_tracker
+from circuit_breaker import CircuitOpenError, breakers
+from model_selection import EMPTY, ERROR, OK, model_selector
+from metrics import model_call_seconds, model_calls_total
+from agreement import collapse_shared_sentences, consensus_policy
+from prompt_budget import fit_responses
+from dotenv import load_dotenv
+import tracing
+import asyncio
+import math
+import os
+import time
+
+load_dotenv()
+
+# Shared building blocks for the ensemble blueprints (chat_routes, trial_chat).
+
+# Ensemble used when a request sends no "models": "auto" picks it from live
+# latency and health stats, "all" fans out to every configured model
+DEFAULT_MODELS = os.getenv("DEFAULT_MODELS", "auto")
+
+# Synthesis starts once SYNTHESIS_QUORUM models answered (0 = all of them) or
+# SYNTHESIS_SOFT_DEADLINE seconds passed; stragglers still stream afterwards.
+SYNTHESIS_QUORUM = int(os.getenv("SYNTHESIS_QUORUM", "0"))
+SYNTHESIS_SOFT_DEADLINE = float(os.getenv("SYNTHESIS_SOFT_DEADLINE", "30"))
+
+# The fan-out as a whole is cut off this long after the slowest per-call
+# deadline, leaving room for memory loading and scheduler queueing
+FANOUT_GRACE_S = 30
+
+
+def parse_ensemble_options(data):
+    """
+    (min_for_synthesis, quorum, soft_deadline, latency_budget) from a request
+    body, defaults filled in. Raises ValueError with a message for the client
+    when a value is malformed or out of range.
+    """
+    try:
+        min_for_synthesis = int(data.get("min_for_synthesis", 2))
+        quorum = int(data.get("quorum", SYNTHESIS_QUORUM))
+        soft_deadline = float(data.get("soft_deadline", SYNTHESIS_SOFT_DEADLINE))
+        latency_budget = data.get("latency_budget")
+        latency_budget = float(latency_budget) if latency_budget is not None else None
+    except (TypeError, ValueError):
+        raise ValueError(
+            "min_for_synthesis and quorum must be integers, soft_deadline and latency_budget numbers"
+        ) from None
+
+    if min_for_synthesis < 1:
+        raise ValueError("min_for_synthesis must be at least 1")
+    if quorum < 0:
+        raise ValueError("quorum must be 0 (all models) or more")
+    if not 0 <= soft_deadline <= 600:
+        raise ValueError("soft_deadline must be between 0 and 600 seconds")
+    if latency_budget is not None and not (latency_budget > 0 and math.isfinite(latency_budget)):
+        raise ValueError("latency_budget must be a positive number of seconds")
+    return min_for_synthesis, quorum, soft_deadline, latency_budget
+
+
+def fanout_timeout(hf_models):
+    """Overall backstop for a fan-out over hf_models, above their per-call deadlines."""
+    return max(
+        (latency_tracker.deadline(hf_model) for hf_model in hf_models),
+        default=latency_tracker.default_deadline,
+    ) + FANOUT_GRACE_S
+
+
+def check_consensus(included):
+    """consensus_policy.check() recorded as a "consensus" span; returns (pick, report)."""
+    with tracing.span("consensus") as span:
+        pick, report = consensus_policy.check(included)
+        span.set(fired=pick is not None, agreement=report["agreement"])
+    return pick, report
+
+
+async def prepare_synthesis(included, build_prompt):
+    """
+    Sentences several models share are sent once; the remaining responses
+    are trimmed to the input budget, the rest of the prompt is never cut.
+    build_prompt(included, shared) renders the prompt. Returns (prompt,
+    report) where report is the token budget report with a "dedup" entry.
+
+    The NumPy work takes tens of milliseconds, so it runs in a worker thread
+    instead of stalling every other stream on the engine loop.
+    """
+    return await asyncio.to_thread(_prepare_synthesis, included, build_prompt)
+
+
+def _prepare_synthesis(included, build_prompt):
+    included, shared, dedup = collapse_shared_sentences(included)
+    skeleton = build_prompt([{**r, "response": ""} for r in included], shared)
+    included, report = fit_responses(included, skeleton)
+    report["dedup"] = dedup
+    if report["trimmed"] or dedup["shared"]:
+        print(f"[ensemble] Synthesis prompt reduced: {report}")
+    return build_prompt(included, shared), report
+
+
+async def stream_completion(client, hf_model, messages, on_chunk=None, **kwargs):
+    """Stream a chat completion, calling on_chunk(text) per delta. Returns the full text."""
+    stream = await client.chat.completions.create(
+        model=hf_model,
+        messages=messages,
+        stream=True,
+        **kwargs,
+    )
+
+    parts = []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content
+        if content:
+            parts.append(content)
+            if on_chunk:
+                on_chunk(content)
+    return "".join(parts)
+
+
+async def _call_route(client, user_key, hf_model, messages, on_chunk=None, **kwargs):
+    deadline = latency_tracker.deadline(hf_model)
+    with tracing.span("upstream", route=hf_model) as span:
+        queued = time.time()
+        async with model_scheduler.slot(user_key, hf_model):
+            start = time.time()
+            span.set(queued_ms=round((start - queued) * 1000, 3))
+            try:
+                async with asyncio.timeout(deadline):
+                    text = await stream_completion(
+                        client, hf_model, messages, on_chunk=on_chunk, timeout=deadline, **kwargs
+                    )
+            except TimeoutError:
+                latency_tracker.record_timeout(hf_model)
+                raise TimeoutError(f"{hf_model} exceeded its {deadline:.1f}s deadline") from None
+            elapsed = time.time() - start
+
+    latency_tracker.record(hf_model, elapsed)
+    return text, elapsed
+
+
+async def call_model(client, user_key, hf_model, messages, on_chunk=None, fallback=None, **kwargs):
+    """
+    One upstream model call: waits for a scheduler slot, then streams the
+    completion under an adaptive deadline from the latency tracker.
+
+    Each route has a circuit breaker. If hf_model's circuit is open, or the
+    call fails before streaming anything, the fallback route (e.g. the same
+    model on another provider) is tried instead. Raises CircuitOpenError
+    when no route is available. Returns (text, elapsed_seconds, route).
+    """
+    routes = [route for route in (hf_model, fallback) if route]
+    streamed = False
+    last_error = None
+
+    def forward(text):
+        nonlocal streamed
+        streamed = True
+        if on_chunk:
+            on_chunk(text)
+
+    for route in routes:
+        if not breakers.allow(route):
+            model_calls_total.inc(route, "circuit_open")
+            last_error = CircuitOpenError(f"{route} circuit is open")
+            continue
+        try:
+            text, elapsed = await _call_route(client, user_key, route, messages, on_chunk=forward, **kwargs)
+        except asyncio.CancelledError:
+            breakers.abandon(route)
+            raise
+        except Exception as e:
+            breakers.failure(route)
+            model_selector.record(route, ERROR)
+            model_calls_total.inc(route, "timeout" if isinstance(e, TimeoutError) else "error")
+            last_error = e
+            if streamed:
+                # Tokens already reached the client; another route would duplicate them
+                break
+            if route != routes[-1]:
+                print(f"[ensemble] {route} failed ({e}); trying {routes[-1]}")
+            continue
+
+        breakers.success(route, elapsed)
+        outcome = OK if text.strip() else EMPTY
+        model_selector.record(route, outcome)
+        model_calls_total.inc(route, outcome)
+        model_call_seconds.observe(elapsed, route)
+        return text, elapsed, route
+
+    raise last_error
+
+
+def quorum_reached(successes, finished, total, quorum, min_results, deadline_passed):
+    """
+    Whether synthesis can start: every call finished, or at least min_results
+    succeeded and either the quorum (0 = all) is met or the soft deadline passed.
+    """
+    if finished >= total:
+        return True
+    if successes < min_results:
+        return False
+    return deadline_passed or (quorum > 0 and successes >= quorum)
+
+
+async def fan_out(calls, timeout=None, soft_deadline=None):
+    """
+    Run model calls concurrently and yield their events as they happen:
+
+        ("chunk", label, text)    a streamed delta
+        ("result", label, value)  a call finished
+        ("error", label, exc)     a call raised
+        ("deadline", None, None)  soft_deadline passed (calls keep running)
+        ("timeout", None, None)   the overall timeout passed (last event)
+
+    calls is a list of (label, fn) where fn(on_chunk) is a coroutine function.
+    The consumer may stop iterating and resume later (e.g. from merge()).
+    Unfinished calls are cancelled when the generator exits.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    async def run(label, fn):
+        try:
+            result = await fn(lambda text: events.put_nowait(("chunk", label, text)))
+            events.put_nowait(("result", label, result))
+        except Exception as e:
+            events.put_nowait(("error", label, e))
+
+    tasks = [asyncio.create_task(run(label, fn)) for label, fn in calls]
+    pending = len(tasks)
+    started = loop.time()
+    deadline = started + timeout if timeout else None
+    soft = started + soft_deadline if soft_deadline else None
+
+    try:
+        while pending:
+            wake = min((t for t in (deadline, soft) if t is not None), default=None)
+            remaining = None if wake is None else max(0.0, wake - loop.time())
+            try:
+                event = await asyncio.wait_for(events.get(), remaining)
+            except asyncio.TimeoutError:
+                if soft is not None and loop.time() >= soft:
+                    soft = None
+                    yield ("deadline", None, None)
+                    continue
+                yield ("timeout", None, None)
+                return
+
+            if event[0] != "chunk":
+                pending -= 1
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def merge(*sources):
+    """Interleave several async iterators, yielding items as they arrive."""
+    items = asyncio.Queue()
+    finished = object()
+
+    async def drain(source):
+        try:
+            async for item in source:
+                await items.put(item)
+        finally:
+            items.put_nowait(finished)
+
+    tasks = [asyncio.create_task(drain(source)) for source in sources]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await items.get()
+            if item is finished:
+                remaining -= 1
+                continue
+            yield item
+        # Surface errors raised inside a source
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,121 @@
+from dotenv import load_dotenv
+import math
+import os
+import threading
+
+load_dotenv()
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram: log-spaced buckets with a fixed relative error
+    (growth - 1), constant memory and O(buckets) quantiles. Counts are halved
+    once they reach decay_at so old samples fade out.
+    """
+
+    def __init__(self, min_s=0.001, max_s=600.0, growth=1.05, decay_at=2000):
+        self.min_s = min_s
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.counts = [0.0] * (math.ceil(math.log(max_s / min_s) / self._log_growth) + 1)
+        self.total = 0.0
+        self.decay_at = decay_at
+
+    def record(self, seconds):
+        if seconds <= self.min_s:
+            idx = 0
+        else:
+            idx = min(len(self.counts) - 1, math.ceil(math.log(seconds / self.min_s) / self._log_growth))
+        self.counts[idx] += 1
+        self.total += 1
+
+        if self.total >= self.decay_at:
+            self.counts = [c / 2 for c in self.counts]
+            self.total /= 2
+
+    def quantile(self, q):
+        if not self.total:
+            return None
+        target = q * self.total
+        seen = 0.0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.min_s * self.growth ** idx
+        return self.min_s * self.growth ** (len(self.counts) - 1)
+
+
+class LatencyTracker:
+    """
+    Per-hf_model latency histograms. A call's deadline is quantile x factor,
+    clamped to [min_deadline, max_deadline]; until min_samples successes are
+    seen the static default_deadline is used.
+    """
+
+    def __init__(self, quantile=0.99, factor=1.5, min_deadline=10.0, max_deadline=120.0,
+                 default_deadline=90.0, min_samples=20):
+        self.q = quantile
+        self.factor = factor
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.default_deadline = default_deadline
+        self.min_samples = min_samples
+
+        self._histograms = {}
+        self._samples = {}
+        self._timeouts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            quantile=float(os.getenv("DEADLINE_QUANTILE", "0.99")),
+            factor=float(os.getenv("DEADLINE_FACTOR", "1.5")),
+            min_deadline=float(os.getenv("DEADLINE_MIN", "10")),
+            max_deadline=float(os.getenv("DEADLINE_MAX", "120")),
+            default_deadline=float(os.getenv("DEADLINE_DEFAULT", "90")),
+            min_samples=int(os.getenv("DEADLINE_MIN_SAMPLES", "20")),
+        )
+
+    def record(self, hf_model, seconds):
+        with self._lock:
+            if hf_model not in self._histograms:
+                self._histograms[hf_model] = LatencyHistogram()
+            self._histograms[hf_model].record(seconds)
+            self._samples[hf_model] = self._samples.get(hf_model, 0) + 1
+
+    def record_timeout(self, hf_model):
+        with self._lock:
+            self._timeouts[hf_model] = self._timeouts.get(hf_model, 0) + 1
+
+    def quantile(self, hf_model, q):
+        with self._lock:
+            histogram = self._histograms.get(hf_model)
+            return histogram.quantile(q) if histogram else None
+
+    def deadline(self, hf_model):
+        with self._lock:
+            histogram = self._histograms.get(hf_model)
+            if histogram is None or self._samples.get(hf_model, 0) < self.min_samples:
+                return self.default_deadline
+            tail = histogram.quantile(self.q)
+        return min(self.max_deadline, max(self.min_deadline, tail * self.factor))
+
+    def snapshot(self):
+        with self._lock:
+            models = set(self._histograms) | set(self._timeouts)
+        report = {}
+        for hf_model in sorted(models):
+            p50, p90, p99 = (self.quantile(hf_model, q) for q in (0.5, 0.9, 0.99))
+            report[hf_model] = {
+                "samples": self._samples.get(hf_model, 0),
+                "timeouts": self._timeouts.get(hf_model, 0),
+                "p50_s": round(p50, 3) if p50 is not None else None,
+                "p90_s": round(p90, 3) if p90 is not None else None,
+                "p99_s": round(p99, 3) if p99 is not None else None,
+                "deadline_s": round(self.deadline(hf_model), 3),
+            }
+        return report
+
+
+latency_tracker = LatencyTracker.from_env()
@@ -5,6 +5,13 @@ from chat_routes import chat_routes
 from user_routes import user_routes
 from trial_chat import trial_chat_routes
 from google_auth import google_auth_blueprint
+from status_routes import status_routes
+from metrics import metrics, metrics_routes
+from scheduler import model_scheduler
+import engine
+from persistence import chat_writer
+from chat_routes import memory_extractor
+from db_schema import ensure_schema
 import secrets
 from dotenv import load_dotenv
 
@@ -23,7 +30,35 @@ app.register_blueprint(chat_routes)
 app.register_blueprint(user_routes)
 app.register_blueprint(trial_chat_routes)
 app.register_blueprint(google_auth_blueprint)
+app.register_blueprint(status_routes)
+app.register_blueprint(metrics_routes)
+
+# Queue depths are read when /metrics is scraped, nothing runs per request.
+# Scheduler state is only touched on the engine loop, so it is read there.
+metrics.gauge("threadwork_scheduler_queue_depth", "Model calls waiting for a scheduler slot",
+              function=lambda: engine.call(model_scheduler.stats, timeout=1)["queue_depth"])
+metrics.gauge("threadwork_model_calls_in_flight", "Model calls holding a scheduler slot",
+              function=lambda: sum(engine.call(model_scheduler.stats, timeout=1)["active_by_provider"].values()))
+metrics.gauge("threadwork_persist_queue_depth", "Chat rows waiting for the write-behind worker",
+              function=lambda: chat_writer.stats()["queue_depth"])
+metrics.gauge("threadwork_memory_extraction_queue_depth", "Exchanges waiting for memory extraction",
+              function=lambda: memory_extractor.stats()["queued"])
+
+
+# Create backend-owned tables (e.g. chat_model_responses) if missing. This
+# runs as an explicit step, not on import, so a down database cannot hold up
+# loading the app for the pool timeout: `flask --app main init-db` (or
+# `python db_schema.py`) before serving, or automatically with `python main.py`.
+@app.cli.command("init-db")
+def init_db():
+    ensure_schema()
+    print("[main] Schema is up to date")
+
 
 if __name__ == "__main__":
+    try:
+        ensure_schema()
+    except Exception as e:
+        print(f"[main] Schema check failed: {e}")
     app.run(port=5000, debug=True)
 
@@ -0,0 +1,184 @@
+from ensemble import call_model
+from persistence import update_memory_summaries
+from dotenv import load_dotenv
+import asyncio
+import json
+import os
+import re
+
+load_dotenv()
+
+# Long-term memory is about the user, so an exchange is only worth an LLM
+# call when the user talks about themselves in a way that could last.
+_FIRST_PERSON = re.compile(r"\b(i|i'm|im|i've|i'd|i'll|me|my|mine|myself|we|we're|our|us)\b", re.I)
+_STABLE_CUES = re.compile(
+    r"\b(prefer|like|love|hate|dislike|enjoy|always|never|usually|name|call me|i am|i'm|im|"
+    r"work|working|job|career|company|team|project|building|goal|goals|plan|planning|learning|"
+    r"studying|remember|allergic|vegan|vegetarian|based in|live in|living in|moved|"
+    r"favorite|favourite|stack|use|using|budget|deadline)\b",
+    re.I,
+)
+
+_LINE = re.compile(r"^\s*\[?(\d+)\]?\s*[:.)-]\s*(.+?)\s*$")
+
+
+def is_ephemeral(user_message):
+    """Cheap pre-filter: True when the exchange can't carry stable user memory."""
+    return not (_FIRST_PERSON.search(user_message) and _STABLE_CUES.search(user_message))
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def build_prompt(items, max_response_chars):
+    exchanges = "\n\n".join(
+        f"[{n}]\nUser: {item['user_message']}\nAssistant: {item['response'][:max_response_chars]}"
+        for n, item in enumerate(items, 1)
+    )
+    return f"""
+Extract long-term memory about the user from each numbered exchange.
+Keep only stable facts: preferences, long-term goals, important constraints.
+Ignore one-off questions.
+
+Reply with a JSON object mapping each exchange number to its memory string,
+or null when there is nothing stable, e.g. {{"1": "Prefers Python", "2": null}}
+
+EXCHANGES:
+{exchanges}
+"""
+
+
+def parse_memories(text, count):
+    """Per-item memories from a batch reply (JSON object, or "n: memory" lines)."""
+    memories = [None] * count
+
+    match = re.search(r"\{.*\}", text, re.S)
+    try:
+        parsed = json.loads(match.group(0)) if match else None
+    except ValueError:
+        parsed = None
+
+    if isinstance(parsed, dict):
+        pairs = parsed.items()
+    else:
+        pairs = [(m.group(1), m.group(2)) for m in map(_LINE.match, text.splitlines()) if m]
+
+    for key, value in pairs:
+        try:
+            idx = int(key) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < count and isinstance(value, str):
+            value = value.strip()
+            if value and value.upper() not in ("NONE", "NULL"):
+                memories[idx] = value
+    return memories
+
+
+class MemoryExtractor:
+    """
+    Deferred long-term memory extraction. Saved chats are queued here; a
+    heuristic drops ephemeral exchanges and the rest are sent batch_size at a
+    time (or after max_wait seconds) in one extraction prompt. Results are
+    written to chats.memory_summary. Runs on the engine loop.
+    """
+
+    def __init__(self, client, batch_size=8, max_wait=10.0, max_queue=500, max_response_chars=1500):
+        self.client = client
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_response_chars = max_response_chars
+        self._queue = None
+        self._max_queue = max_queue
+        self._worker = None
+
+        self.exchanges = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.extracted = 0
+        self.failed = 0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.baseline_prompt_tokens = 0
+
+    @classmethod
+    def from_env(cls, client):
+        return cls(
+            client,
+            batch_size=int(os.getenv("MEMORY_BATCH_SIZE", "8")),
+            max_wait=float(os.getenv("MEMORY_BATCH_WAIT", "10")),
+            max_queue=int(os.getenv("MEMORY_QUEUE_SIZE", "500")),
+        )
+
+    def submit(self, chat_id, user_message, response):
+        """Queue one saved exchange. Must be called on the engine loop."""
+        self.exchanges += 1
+        # What the old one-call-per-chat prompt would have cost
+        self.baseline_prompt_tokens += estimate_tokens(user_message) + estimate_tokens(response) + 20
+
+        if is_ephemeral(user_message):
+            self.skipped += 1
+            return
+
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._queue.put_nowait({"chat_id": chat_id, "user_message": user_message, "response": response})
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            flush_at = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), max(0.0, flush_at - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._extract(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"[memory] Batch extraction error: {e}")
+
+    async def _extract(self, batch):
+        prompt = build_prompt(batch, self.max_response_chars)
+        text, _, _ = await call_model(
+            self.client,
+            "memory-extractor",
+            "openai/gpt-oss-20b:novita",
+            [{"role": "user", "content": prompt}],
+            max_tokens=120 * len(batch),
+        )
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(prompt)
+        self.completion_tokens += estimate_tokens(text)
+
+        memories = parse_memories(text, len(batch))
+        updates = [(memory, item["chat_id"]) for item, memory in zip(batch, memories) if memory]
+        if updates:
+            await asyncio.to_thread(update_memory_summaries, updates)
+        self.extracted += len(updates)
+
+    def stats(self):
+        return {
+            "exchanges": self.exchanges,
+            "skipped_by_filter": self.skipped,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "dropped": self.dropped,
+            "extraction_calls": self.calls,
+            "baseline_calls": self.exchanges,
+            "call_reduction": round(1 - self.calls / self.exchanges, 4) if self.exchanges else 0.0,
+            "memories_extracted": self.extracted,
+            "failed": self.failed,
+            "est_prompt_tokens": self.prompt_tokens,
+            "est_completion_tokens": self.completion_tokens,
+            "est_baseline_prompt_tokens": self.baseline_prompt_tokens,
+            "est_token_reduction": round(1 - self.prompt_tokens / self.baseline_prompt_tokens, 4)
+            if self.baseline_prompt_tokens else 0.0,
+        }
@@ -0,0 +1,223 @@
+from bisect import bisect_left
+from flask import Blueprint, Response
+import math
+import threading
+
+# In-process metrics served in the Prometheus text exposition format at
+# /metrics. Recording is a dict lookup and an add under a per-metric lock;
+# cumulative buckets and label formatting only happen when scraped.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labels:
+            # Unlabeled series are exposed as 0 before the first sample
+            self._values[()] = self._zero()
+
+    def _zero(self):
+        return 0
+
+    def _check(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {labels}")
+
+    def samples(self):
+        """(suffix, label values, extra label, value) per exposed sample."""
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield "", labels, None, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, labels, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from function() when scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value, *labels):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.function is None:
+            yield from super().samples()
+            return
+        try:
+            value = self.function()
+        except Exception as e:
+            print(f"[metrics] Gauge {self.name} failed: {e}")
+            return
+        yield "", (), None, value
+
+
+class Histogram(_Metric):
+    """
+    Fixed upper-bound buckets, counted per bucket on observe() and made
+    cumulative when scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _zero(self):
+        # One count per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value, *labels):
+        self._check(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = self._zero()
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._values.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                yield "_bucket", labels, ("le", _format_value(float(bound))), cumulative
+            yield "_sum", labels, None, series[-1]
+            yield "_count", labels, None, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, cls):
+                    raise ValueError(f"{name} is already registered as a {existing.kind}")
+                return existing
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._register(Gauge, name, help, labels, function=function)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# -------- Request phases -------- #
+
+memory_read_seconds = metrics.histogram(
+    "threadwork_memory_read_seconds", "Time to read recent chats for the memory context")
+memory_condense_seconds = metrics.histogram(
+    "threadwork_memory_condense_seconds", "Duration of the memory condense model call", ("outcome",))
+
+scheduler_wait_seconds = metrics.histogram(
+    "threadwork_scheduler_wait_seconds", "Time model calls waited for a scheduler slot", ("provider",))
+
+model_call_seconds = metrics.histogram(
+    "threadwork_model_call_seconds", "Duration of successful upstream model calls", ("route",))
+model_calls_total = metrics.counter(
+    "threadwork_model_calls_total", "Upstream model calls by route and outcome", ("route", "outcome"))
+
+synthesis_ttft_seconds = metrics.histogram(
+    "threadwork_synthesis_ttft_seconds", "Time from synthesis start to its first token", ("endpoint",))
+synthesis_seconds = metrics.histogram(
+    "threadwork_synthesis_seconds", "Total synthesis duration", ("endpoint",))
+synthesis_total = metrics.counter(
+    "threadwork_synthesis_total", "Syntheses by endpoint and source (llm or consensus)", ("endpoint", "source"))
+
+db_write_seconds = metrics.histogram(
+    "threadwork_db_write_seconds", "Duration of chat row write transactions")
+db_rows_written_total = metrics.counter(
+    "threadwork_db_rows_written_total", "Chat rows committed")
+db_write_errors_total = metrics.counter(
+    "threadwork_db_write_errors_total", "Chat row write transactions that failed")
+
+# -------- SSE -------- #
+
+sse_streams_in_flight = metrics.gauge(
+    "threadwork_sse_streams_in_flight", "SSE streams currently being written")
+sse_bytes_total = metrics.counter(
+    "threadwork_sse_bytes_total", "Encoded SSE text written, in characters")
+sse_writes_total = metrics.counter(
+    "threadwork_sse_writes_total", "SSE writes (each holds one or more frames)")
+
+
+metrics_routes = Blueprint('metrics', __name__)
+
+
+@metrics_routes.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,159 @@
+from collections import deque
+from dotenv import load_dotenv
+from latency import latency_tracker
+from circuit_breaker import OPEN, breakers
+import os
+import threading
+import time
+
+load_dotenv()
+
+OK = "ok"
+ERROR = "error"
+EMPTY = "empty"
+
+
+class ModelSelector:
+    """
+    Picks the ensemble for requests that leave the models to the server.
+
+    Every route's recent call outcomes (ok / error / empty) are kept in a
+    window of `window` calls. A model is eligible when one of its routes
+    has a usable circuit, its error + empty rate is below max_failure_rate
+    and its latency quantile (from latency_tracker) fits the budget. Models
+    with fewer than min_samples calls are eligible so they get measured, and
+    a rejected model is let through once every probe_after_s so its stats
+    can recover. If fewer than min_models are eligible, the best-scoring
+    rejected models are added to keep the ensemble diverse enough to
+    synthesize from.
+    """
+
+    def __init__(self, budget_s=20.0, min_models=2, quantile=0.9, max_failure_rate=0.5,
+                 window=20, min_samples=5, probe_after_s=60.0):
+        self.budget_s = budget_s
+        self.min_models = min_models
+        self.quantile = quantile
+        self.max_failure_rate = max_failure_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.probe_after_s = probe_after_s
+
+        self._outcomes = {}
+        self._last_call = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            budget_s=float(os.getenv("MODEL_SELECTION_BUDGET_S", "20")),
+            min_models=int(os.getenv("MODEL_SELECTION_MIN_MODELS", "2")),
+            quantile=float(os.getenv("MODEL_SELECTION_QUANTILE", "0.9")),
+            max_failure_rate=float(os.getenv("MODEL_SELECTION_MAX_FAILURE_RATE", "0.5")),
+            window=int(os.getenv("MODEL_SELECTION_WINDOW", "20")),
+            min_samples=int(os.getenv("MODEL_SELECTION_MIN_SAMPLES", "5")),
+            probe_after_s=float(os.getenv("MODEL_SELECTION_PROBE_AFTER_S", "60")),
+        )
+
+    def record(self, hf_model, outcome):
+        with self._lock:
+            if hf_model not in self._outcomes:
+                self._outcomes[hf_model] = deque(maxlen=self.window)
+            self._outcomes[hf_model].append(outcome)
+            self._last_call[hf_model] = time.monotonic()
+
+    def _claim_probe(self, hf_model):
+        # One request per probe_after_s gets to call a rejected route
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_call.get(hf_model, 0.0) < self.probe_after_s:
+                return False
+            self._last_call[hf_model] = now
+            return True
+
+    def _rates(self, hf_model):
+        with self._lock:
+            outcomes = list(self._outcomes.get(hf_model, ()))
+        if not outcomes:
+            return 0, 0.0, 0.0
+        total = len(outcomes)
+        return total, outcomes.count(ERROR) / total, outcomes.count(EMPTY) / total
+
+    def _route_health(self, hf_model):
+        calls, error_rate, empty_rate = self._rates(hf_model)
+        latency = latency_tracker.quantile(hf_model, self.quantile) if calls >= self.min_samples else None
+        return {
+            "route": hf_model,
+            "circuit": breakers.state(hf_model),
+            "calls": calls,
+            "error_rate": round(error_rate, 3),
+            "empty_rate": round(empty_rate, 3),
+            f"p{round(self.quantile * 100)}_s": round(latency, 3) if latency is not None else None,
+            "_latency": latency,
+            "_failure": error_rate + empty_rate if calls >= self.min_samples else 0.0,
+        }
+
+    def _assess(self, key, cfg, budget_s):
+        routes = [self._route_health(route) for route in (cfg["hf_model"], cfg.get("fallback")) if route]
+        usable = [r for r in routes if r["circuit"] != OPEN]
+        best = min(usable or routes, key=lambda r: (r["_failure"], r["_latency"] or 0.0))
+        latency, failure = best["_latency"], best["_failure"]
+
+        if not usable:
+            reason = "circuit open"
+        elif failure >= self.max_failure_rate:
+            reason = f"failure rate {failure:.0%}"
+        elif latency is not None and latency > budget_s:
+            reason = f"p{round(self.quantile * 100)} {latency:.1f}s over {budget_s:g}s budget"
+        else:
+            reason = None
+
+        report = {"model": key, **{k: v for k, v in best.items() if not k.startswith("_")}}
+        if reason is not None and usable and self._claim_probe(best["route"]):
+            report["reason"] = f"probe ({reason})"
+            reason = None
+
+        # Lower is better: failing models last, then slower ones
+        score = (not usable, failure, latency if latency is not None else budget_s)
+        return reason, score, report
+
+    def select(self, model_configs, budget_s=None, min_models=None):
+        """
+        Returns (chosen keys in config order, report). The report lists
+        every candidate with its stats, whether it was chosen and why.
+        """
+        budget_s = self.budget_s if budget_s is None else budget_s
+        min_models = min(self.min_models if min_models is None else min_models, len(model_configs))
+
+        assessed = {key: self._assess(key, cfg, budget_s) for key, cfg in model_configs.items()}
+        chosen = {key for key, (reason, _, _) in assessed.items() if reason is None}
+        for key, (reason, _, report) in assessed.items():
+            report["chosen"] = reason is None
+            report.setdefault("reason", "healthy, within budget" if reason is None else reason)
+
+        backfill = sorted((key for key in assessed if key not in chosen), key=lambda key: assessed[key][1])
+        for key in backfill[:max(0, min_models - len(chosen))]:
+            chosen.add(key)
+            report = assessed[key][2]
+            report["chosen"] = True
+            report["reason"] = f"{report['reason']}; kept for minimum of {min_models} models"
+
+        keys = [key for key in model_configs if key in chosen]
+        return keys, {
+            "mode": "auto",
+            "budget_s": budget_s,
+            "min_models": min_models,
+            "chosen": keys,
+            "models": [assessed[key][2] for key in model_configs],
+        }
+
+    def snapshot(self):
+        with self._lock:
+            routes = sorted(self._outcomes)
+        report = {}
+        for hf_model in routes:
+            health = self._route_health(hf_model)
+            report[hf_model] = {k: v for k, v in health.items() if not k.startswith("_") and k != "route"}
+        return report
+
+
+model_selector = ModelSelector.from_env()
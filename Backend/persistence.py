@@ -0,0 +1,260 @@
+from concurrent.futures import Future
+from db_connection import get_db_connection, get_pool
+from metrics import db_rows_written_total, db_write_errors_total, db_write_seconds
+from dotenv import load_dotenv
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import time
+
+load_dotenv()
+
+_STOP = object()
+
+
+def write_chats(rows):
+    """
+    Insert chat rows and their per-model responses in one transaction.
+    Each row is a dict with user_id, user_message, model_response,
+    memory_summary and model_responses. Returns the new chat ids in order.
+    """
+    start = time.perf_counter()
+    try:
+        chat_ids = _insert_chats(rows)
+    except Exception:
+        db_write_errors_total.inc()
+        raise
+    db_write_seconds.observe(time.perf_counter() - start)
+    db_rows_written_total.inc(amount=len(chat_ids))
+    return chat_ids
+
+
+def _insert_chats(rows):
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.executemany("""
+            INSERT INTO chats (user_id, user_message, model_response, memory_summary)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        """, [
+            (r["user_id"], r["user_message"], r["model_response"], r.get("memory_summary"))
+            for r in rows
+        ], returning=True)
+
+        chat_ids = []
+        while True:
+            chat_ids.append(cursor.fetchone()[0])
+            if not cursor.nextset():
+                break
+
+        with cursor.copy("""
+            COPY chat_model_responses (chat_id, model, route, response, outcome, error, latency_ms)
+            FROM STDIN
+        """) as copy:
+            for chat_id, row in zip(chat_ids, rows):
+                for r in row.get("model_responses") or ():
+                    copy.write_row((chat_id, r["model"], r["route"], r["response"], r["outcome"], r["error"], r["latency_ms"]))
+
+        connection.commit()
+        cursor.close()
+    return chat_ids
+
+
+def update_memory_summaries(updates):
+    """Set memory_summary for saved chats; updates is a list of (memory_summary, chat_id)."""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.executemany("""
+            UPDATE chats
+            SET memory_summary = %s
+            WHERE id = %s
+        """, updates)
+        connection.commit()
+        cursor.close()
+
+
+class _Item:
+    __slots__ = ("row", "future", "enqueued_at")
+
+    def __init__(self, row):
+        self.row = row
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class ChatWriteBehind:
+    """
+    One background thread that persists chats in multi-row batches.
+
+    Rows wait in a bounded queue and are flushed when batch_size rows are
+    pending or the oldest has waited flush_interval seconds. A full queue
+    pushes back on the caller for up to enqueue_timeout seconds, after which
+    the row is written directly. Pending rows are flushed at exit.
+    """
+
+    def __init__(self, max_queue=1000, batch_size=50, flush_interval=0.5, enqueue_timeout=5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.direct_writes = 0
+        self.batches = 0
+        self.flushes = {"size": 0, "time": 0, "shutdown": 0}
+        self.max_queue_depth = 0
+        self.total_lag_s = 0.0
+        self.max_lag_s = 0.0
+        self.last_lag_s = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_queue=int(os.getenv("PERSIST_QUEUE_SIZE", "1000")),
+            batch_size=int(os.getenv("PERSIST_BATCH_SIZE", "50")),
+            flush_interval=float(os.getenv("PERSIST_FLUSH_INTERVAL", "0.5")),
+            enqueue_timeout=float(os.getenv("PERSIST_ENQUEUE_TIMEOUT", "5")),
+        )
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    # Open the pool first so its atexit close runs after our flush
+                    get_pool()
+                    self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def submit(self, row, timeout=None):
+        """Queue a row; returns a Future resolving to its chat id. Raises queue.Full."""
+        self._ensure_started()
+        item = _Item(row)
+        self._queue.put(item, block=bool(timeout), timeout=timeout or None)
+        with self._stats_lock:
+            self.enqueued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return item.future
+
+    async def save(self, row):
+        """Queue a row from the engine loop and wait until it is committed."""
+        try:
+            future = self.submit(row)
+        except queue.Full:
+            try:
+                future = await asyncio.to_thread(self.submit, row, self.enqueue_timeout)
+            except queue.Full:
+                print("[persistence] Queue full, writing chat directly")
+                with self._stats_lock:
+                    self.direct_writes += 1
+                return (await asyncio.to_thread(write_chats, [row]))[0]
+        return await asyncio.wrap_future(future)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = [first]
+            reason = "time"
+            flush_at = first.enqueued_at + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    reason = "shutdown"
+                    break
+                batch.append(item)
+            else:
+                reason = "size"
+
+            self._flush(batch, reason)
+
+        # Drain whatever is still queued
+        rest = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                rest.append(item)
+        for start in range(0, len(rest), self.batch_size):
+            self._flush(rest[start:start + self.batch_size], "shutdown")
+
+    def _flush(self, batch, reason):
+        try:
+            chat_ids = write_chats([item.row for item in batch])
+        except Exception as e:
+            print(f"[persistence] Batch of {len(batch)} failed ({e}), retrying rows one by one")
+            chat_ids = []
+            for item in batch:
+                try:
+                    chat_ids.append(write_chats([item.row])[0])
+                except Exception as row_err:
+                    chat_ids.append(row_err)
+
+        now = time.monotonic()
+        with self._stats_lock:
+            self.batches += 1
+            self.flushes[reason] += 1
+            for item, chat_id in zip(batch, chat_ids):
+                lag = now - item.enqueued_at
+                self.total_lag_s += lag
+                self.max_lag_s = max(self.max_lag_s, lag)
+                self.last_lag_s = lag
+                if isinstance(chat_id, Exception):
+                    self.failed += 1
+                else:
+                    self.written += 1
+
+        for item, chat_id in zip(batch, chat_ids):
+            if isinstance(chat_id, Exception):
+                item.future.set_exception(chat_id)
+            else:
+                item.future.set_result(chat_id)
+
+    def close(self, timeout=10):
+        """Flush pending rows and stop the worker."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            done = self.written + self.failed
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "queue_capacity": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "failed": self.failed,
+                "direct_writes": self.direct_writes,
+                "batches": self.batches,
+                "avg_batch_size": round(done / self.batches, 2) if self.batches else 0.0,
+                "flushes": dict(self.flushes),
+                "avg_lag_ms": round(self.total_lag_s * 1000 / done, 3) if done else 0.0,
+                "max_lag_ms": round(self.max_lag_s * 1000, 3),
+                "last_lag_ms": round(self.last_lag_s * 1000, 3),
+            }
+
+
+chat_writer = ChatWriteBehind.from_env()
@@ -0,0 +1,121 @@
+from dotenv import load_dotenv
+from text_vectors import words
+import os
+import re
+
+load_dotenv()
+
+# Synthesis input budget. Model responses are trimmed to fit it; the prompt
+# template, question and memory are never cut.
+SYNTHESIS_INPUT_BUDGET = int(os.getenv("SYNTHESIS_INPUT_BUDGET", "6000"))
+
+# Roughly one BPE token per short word, per 5 letters of a long word and per
+# punctuation mark; close enough to budget with, no tokenizer download.
+_TOKEN = re.compile(r"\w{1,5}|[^\w\s]")
+
+# Fenced code is kept or dropped as a whole; prose is split into sentences
+# that keep their trailing whitespace, so kept pieces join back verbatim.
+_FENCE = re.compile(r"```.*?(?:```|$)\s*", re.DOTALL)
+_SENTENCE = re.compile(r"[^\n]*?(?:(?<!\d)(?<!\be\.g)(?<!\bi\.e)[.!?](?=\s)|\n|$)\s*")
+
+_BOILERPLATE = re.compile(
+    r"^\W*(?:i hope (?:this|that) helps|hope (?:this|that) helps|let me know|feel free to|"
+    r"great question|good question|sure[,!.]|certainly[,!.]|of course[,!.]|absolutely[,!.]|"
+    r"as an ai|i'm happy to|i am happy to|happy to help|if you have any (?:other|more|further) questions)",
+    re.IGNORECASE,
+)
+
+
+def estimate_tokens(text):
+    return len(_TOKEN.findall(text)) if text else 0
+
+
+def split_units(text):
+    """Split text into code blocks and sentences; "".join(units) == text."""
+    units = []
+    start = 0
+    for fence in _FENCE.finditer(text):
+        units.extend(m.group() for m in _SENTENCE.finditer(text, start, fence.start()) if m.group())
+        units.append(fence.group())
+        start = fence.end()
+    units.extend(m.group() for m in _SENTENCE.finditer(text, start) if m.group())
+    return units
+
+
+def _score(unit, position, tokens):
+    """
+    Higher is kept first: leading sentences, dense content, numbers and
+    code. position counts non-boilerplate units only.
+    """
+    score = len(set(words(unit))) / max(tokens, 1)
+    if position == 0:
+        score += 1.0
+    elif position == 1:
+        score += 0.5
+    if unit.startswith("```") or any(c.isdigit() for c in unit):
+        score += 0.25
+    return score
+
+
+def shrink(text, max_tokens):
+    """
+    Cut text to about max_tokens by dropping its lowest-scoring sentences
+    and boilerplate. Kept sentences stay in their original order.
+    """
+    units = split_units(text)
+    costs = [estimate_tokens(unit) for unit in units]
+    scores = []
+    position = 0
+    for unit, cost in zip(units, costs):
+        if _BOILERPLATE.match(unit):
+            scores.append(None)
+        else:
+            scores.append(_score(unit, position, cost))
+            position += 1
+    ranked = sorted((i for i, score in enumerate(scores) if score is not None),
+                    key=lambda i: scores[i], reverse=True)
+
+    kept = set()
+    remaining = max_tokens
+    for i in ranked:
+        if costs[i] <= remaining:
+            kept.add(i)
+            remaining -= costs[i]
+
+    if not kept and ranked:
+        # Not even the best sentence fits; keep its leading words
+        best = units[ranked[0]]
+        cut = [m.end() for m in _TOKEN.finditer(best)][:max_tokens]
+        return best[:cut[-1]].rstrip() + " …" if cut else ""
+
+    return "".join(units[i] for i in sorted(kept)).rstrip()
+
+
+def fit_responses(responses, fixed_text, budget=None):
+    """
+    Fit model responses into the synthesis input budget. fixed_text is the
+    rest of the prompt (template, question, memory). Over budget, each
+    response is shrunk in proportion to its size. Returns (responses,
+    report) where report has the estimated prompt tokens before and after.
+    """
+    budget = SYNTHESIS_INPUT_BUDGET if budget is None else budget
+    fixed = estimate_tokens(fixed_text)
+    sizes = [estimate_tokens(r["response"]) for r in responses]
+    before = fixed + sum(sizes)
+
+    report = {"budget": budget, "tokens_before": before, "tokens_after": before, "trimmed": []}
+    available = budget - fixed
+    if before <= budget or not sizes or available <= 0:
+        return responses, report
+
+    scale = available / sum(sizes)
+    fitted = []
+    for r, size in zip(responses, sizes):
+        target = int(size * scale)
+        if size > target:
+            r = {**r, "response": shrink(r["response"], target)}
+            report["trimmed"].append(r["model"])
+        fitted.append(r)
+
+    report["tokens_after"] = fixed + sum(estimate_tokens(r["response"]) for r in fitted)
+    return fitted, report
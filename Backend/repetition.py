@@ -0,0 +1,111 @@
+import re
+
+# A sentence ends at . ! or ? followed by whitespace, or with its line (so
+# list items and headings count as sentences too). A line break right after
+# the punctuation belongs to the sentence; "1." does not end one.
+_BOUNDARY = re.compile(r"(?:(?<!\d)\.|[!?])(?:\n|(?=\s))|\n")
+
+# List bullets, numbering, quotes and heading marks are not part of the key
+_MARKER = re.compile(r"^(?:[-*+>#]+|\d+[.)])\s+")
+
+
+class RepetitionFilter:
+    """
+    Drops repeated sentences from text as it streams. feed() takes each
+    delta and returns the text that is safe to emit; only the unfinished
+    sentence at the end is held back. flush() returns what is left once the
+    stream ends.
+
+    Sentences are compared case- and whitespace-insensitively through a set
+    of hashes, so each character is scanned a constant number of times.
+    Sentences shorter than min_len and everything inside ``` code fences
+    pass through untouched. A dropped sentence takes the whitespace before
+    it, and its line break if it ends a line.
+    """
+
+    def __init__(self, min_len=20):
+        self.min_len = min_len
+        self._seen = set()
+        self._pending = []
+        self._last = ""
+        self._in_code = False
+
+        self.sentences = 0
+        self.dropped = 0
+        self.dropped_chars = 0
+
+    def _emit(self, segment):
+        body = segment.strip()
+        if not body:
+            return segment
+
+        self.sentences += 1
+        if body.startswith("```"):
+            self._in_code = not self._in_code
+            return segment
+        if self._in_code:
+            return segment
+
+        key = " ".join(_MARKER.sub("", body).casefold().split())
+        if len(key) < self.min_len:
+            return segment
+
+        digest = hash(key)
+        if digest in self._seen:
+            self.dropped += 1
+            self.dropped_chars += len(segment)
+            return ""
+        self._seen.add(digest)
+        return segment
+
+    def feed(self, delta):
+        if not delta:
+            return ""
+
+        # The previous delta's last two characters are kept so a "." at its
+        # end followed by a space at the start of this one is still a boundary
+        text = self._last + delta
+        offset = len(self._last)
+        self._last = text[-2:]
+
+        if "\n" not in text and "." not in text and "!" not in text and "?" not in text:
+            self._pending.append(delta)
+            return ""
+
+        out = []
+        start = 0
+        for match in _BOUNDARY.finditer(text):
+            # Boundaries that were decidable within the previous delta
+            if match.end() < offset or (match.end() == offset and match.group().endswith("\n")):
+                continue
+            end = match.end() - offset
+            if end <= start and not self._pending:
+                continue
+            self._pending.append(delta[start:end])
+            out.append(self._emit("".join(self._pending)))
+            self._pending = []
+            start = end
+
+        if start < len(delta):
+            self._pending.append(delta[start:])
+        return "".join(out)
+
+    def flush(self):
+        if not self._pending:
+            return ""
+        segment = "".join(self._pending)
+        self._pending = []
+        return self._emit(segment)
+
+    def stats(self):
+        return {
+            "sentences": self.sentences,
+            "dropped": self.dropped,
+            "dropped_chars": self.dropped_chars,
+        }
+
+
+def strip_repetition(text, min_len=20):
+    """Remove repeated sentences from a complete text."""
+    repetition_filter = RepetitionFilter(min_len)
+    return repetition_filter.feed(text) + repetition_filter.flush()
@@ -0,0 +1,160 @@
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from metrics import scheduler_wait_seconds
+import asyncio
+import os
+import time
+
+load_dotenv()
+
+
+def provider_of(hf_model):
+    """Router suffix of an HF model id, e.g. "...:novita" -> "novita"."""
+    return hf_model.rsplit(":", 1)[1] if ":" in hf_model else "default"
+
+
+def _parse_limits(raw):
+    # "novita=32,together=16" -> {"novita": 32, "together": 16}
+    limits = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class _Waiter:
+    __slots__ = ("hf_model", "provider", "future", "enqueued_at")
+
+    def __init__(self, hf_model, provider, future):
+        self.hf_model = hf_model
+        self.provider = provider
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class ModelScheduler:
+    """
+    Admission control for upstream model calls shared by every blueprint.
+
+    Each call needs a slot on its provider and on its model. Waiting calls are
+    queued per user and granted round-robin across users, so one user's burst
+    cannot starve everyone else. Runs entirely on the engine loop.
+    """
+
+    def __init__(self, provider_limits=None, default_provider_limit=32, model_limit=16):
+        self.provider_limits = provider_limits or {}
+        self.default_provider_limit = default_provider_limit
+        self.model_limit = model_limit
+
+        self._active_provider = defaultdict(int)
+        self._active_model = defaultdict(int)
+        self._queues = OrderedDict()  # user_key -> deque of waiters
+        self._depth = 0
+
+        self.granted = 0
+        self.max_queue_depth = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            provider_limits=_parse_limits(os.getenv("PROVIDER_CONCURRENCY")),
+            default_provider_limit=int(os.getenv("PROVIDER_CONCURRENCY_DEFAULT", "32")),
+            model_limit=int(os.getenv("MODEL_CONCURRENCY", "16")),
+        )
+
+    def _has_capacity(self, waiter):
+        provider_limit = self.provider_limits.get(waiter.provider, self.default_provider_limit)
+        return (
+            self._active_provider[waiter.provider] < provider_limit
+            and self._active_model[waiter.hf_model] < self.model_limit
+        )
+
+    def _dispatch(self):
+        granted = True
+        while granted:
+            granted = False
+            for user_key, queue in self._queues.items():
+                # Cancelled waiters are dropped here if they haven't withdrawn yet
+                waiter = next(
+                    (w for w in queue if w.future.cancelled() or self._has_capacity(w)),
+                    None,
+                )
+                if waiter is None:
+                    continue
+
+                queue.remove(waiter)
+                self._depth -= 1
+                if queue:
+                    # Served users go to the back of the rotation
+                    self._queues.move_to_end(user_key)
+                else:
+                    del self._queues[user_key]
+
+                granted = True
+                if waiter.future.cancelled():
+                    break
+
+                self._active_provider[waiter.provider] += 1
+                self._active_model[waiter.hf_model] += 1
+                waiter.future.set_result(None)
+                break
+
+    def _release(self, waiter):
+        self._active_provider[waiter.provider] -= 1
+        self._active_model[waiter.hf_model] -= 1
+        self._dispatch()
+
+    def _withdraw(self, user_key, waiter):
+        queue = self._queues.get(user_key)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self._depth -= 1
+            if not queue:
+                del self._queues[user_key]
+
+    @asynccontextmanager
+    async def slot(self, user_key, hf_model):
+        waiter = _Waiter(hf_model, provider_of(hf_model), asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user_key, deque()).append(waiter)
+        self._depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._depth)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(waiter)
+            else:
+                self._withdraw(user_key, waiter)
+            raise
+
+        waited = time.monotonic() - waiter.enqueued_at
+        self.granted += 1
+        self.total_wait_s += waited
+        self.max_wait_s = max(self.max_wait_s, waited)
+        scheduler_wait_seconds.observe(waited, waiter.provider)
+
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def stats(self):
+        return {
+            "queue_depth": self._depth,
+            "max_queue_depth": self.max_queue_depth,
+            "waiting_users": len(self._queues),
+            "granted": self.granted,
+            "avg_wait_ms": round(self.total_wait_s * 1000 / self.granted, 3) if self.granted else 0.0,
+            "max_wait_ms": round(self.max_wait_s * 1000, 3),
+            "active_by_provider": {k: v for k, v in self._active_provider.items() if v},
+            "active_by_model": {k: v for k, v in self._active_model.items() if v},
+        }
+
+
+model_scheduler = ModelScheduler.from_env()
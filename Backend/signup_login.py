@@ -28,40 +28,38 @@ def signup():
     # Hashed password
     hashed_password = password_hash(password)
  
-    connection = get_db_connection()
-    cursor = connection.cursor()
- 
-    # Check if the email already exists
-    cursor.execute("""
-        SELECT 1
-        FROM users
-        WHERE email = %(email)s
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+ 
+        # Check if the email already exists
+        cursor.execute("""
+            SELECT 1
+            FROM users
+            WHERE email = %(email)s
+            """, {
+            'email': email
+        })
+        existing_user = cursor.fetchone()
+ 
+        if existing_user:
+            cursor.close()
+            return jsonify({"error": "Email already registered"}), 409
+ 
+        # Hash password and insert if email is free
+        cursor.execute("""
+        INSERT INTO users (email, password, country)
+        VALUES (%(email)s, %(password)s, %(country)s)
+        RETURNING id
         """, {
-        'email': email
-    })
-    existing_user = cursor.fetchone()
+            'email': email,
+            'password': hashed_password,
+            'country': country
+        })
+ 
+        user_id = cursor.fetchone()[0]
  
-    if existing_user:
+        connection.commit()
         cursor.close()
-        connection.close()
-        return jsonify({"error": "Email already registered"}), 409
- 
-    # Hash password and insert if email is free
-    cursor.execute("""
-    INSERT INTO users (email, password, country)
-    VALUES (%(email)s, %(password)s, %(country)s)
-    RETURNING id
-    """, {
-        'email': email,
-        'password': hashed_password,
-        'country': country
-    })
- 
-    user_id = cursor.fetchone()[0]
- 
-    connection.commit()
-    cursor.close()
-    connection.close()
  
     return jsonify({"message": "User created successfully!"}), 200
  
@@ -76,23 +74,22 @@ def login():
         return jsonify({'error': 'Email and password required'}), 400
  
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
- 
-        # Get stored id and password from DB
-        cursor.execute("""
-            SELECT id, password
-            FROM users
-            WHERE email = %(email)s
-        """, {
-            'email': email
-        })
-        row = cursor.fetchone()
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
+ 
+            # Get stored id and password from DB
+            cursor.execute("""
+                SELECT id, password
+                FROM users
+                WHERE email = %(email)s
+            """, {
+                'email': email
+            })
+            row = cursor.fetchone()
+            cursor.close()
  
         # Checks if user exists
         if not row:
-            cursor.close()
-            connection.close()
             return jsonify({"error": "invalid email or password"}), 401
  
         user_id = row[0]
@@ -100,14 +97,10 @@ def login():
  
         # Checks password hash
         if not check_password(password, stored_hash):
-            cursor.close()
-            connection.close()
             return jsonify({"error": "invalid email or password"}), 401
  
         # Authenticate if passwords match
         session['user_id'] = user_id
-        cursor.close()
-        connection.close()
         print(user_id)
  
         return jsonify({"success": "access granted"}), 200
@@ -137,20 +130,19 @@ def check_profile():
         return jsonify({"error": "Not authenticated"}), 401
     
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        cursor.execute("""
-            SELECT full_name, birth_date
-            FROM users
-            WHERE id = %(user_id)s
-        """, {
-            'user_id': user_id
-        })
-        row = cursor.fetchone()
-        
-        cursor.close()
-        connection.close()
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
+            
+            cursor.execute("""
+                SELECT full_name, birth_date
+                FROM users
+                WHERE id = %(user_id)s
+            """, {
+                'user_id': user_id
+            })
+            row = cursor.fetchone()
+            
+            cursor.close()
         
         if row and row[0] and row[1]:
             # Both full_name and birth_date exist
@@ -179,22 +171,21 @@ def complete_google_profile():
         return jsonify({"error": "Full name and birth date required"}), 400
 
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
 
-        cursor.execute("""
-            UPDATE users
-            SET full_name = %(full_name)s, birth_date = %(birth_date)s
-            WHERE id = %(user_id)s
-        """, {
-            'full_name': full_name,
-            'birth_date': birth_date,
-            'user_id': user_id
-        })
+            cursor.execute("""
+                UPDATE users
+                SET full_name = %(full_name)s, birth_date = %(birth_date)s
+                WHERE id = %(user_id)s
+            """, {
+                'full_name': full_name,
+                'birth_date': birth_date,
+                'user_id': user_id
+            })
 
-        connection.commit()
-        cursor.close()
-        connection.close()
+            connection.commit()
+            cursor.close()
 
         return jsonify({"message": "Profile completed successfully"}), 200
 
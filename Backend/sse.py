@@ -0,0 +1,246 @@
+from collections import deque
+from dotenv import load_dotenv
+from metrics import sse_bytes_total, sse_streams_in_flight, sse_writes_total
+import asyncio
+import json
+import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+load_dotenv()
+
+# Streams are produced as (type, data) events and encoded here, once, into
+# SSE frames. Token deltas of the same kind are merged into one frame per
+# interval or byte threshold, so a long answer is tens of writes, not
+# thousands. Frames carry ids; idle connections get comment heartbeats.
+
+HEARTBEAT = ": keep-alive\n\n"
+
+if orjson is not None:
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+else:
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False).encode
+
+
+def _delta_key(event_type, data):
+    """Merge key for token deltas, or None for events sent as they are."""
+    if event_type == "synthesis_chunk" and isinstance(data, str):
+        return event_type
+    if event_type == "model_chunk":
+        return event_type, data["model"]
+    return None
+
+
+class _Frames:
+    """Encoder state of one stream: the next event id and unsent deltas."""
+
+    __slots__ = ("next_id", "pending", "pending_bytes", "flush_at")
+
+    def __init__(self):
+        self.next_id = 0
+        self.pending = {}
+        self.pending_bytes = 0
+        self.flush_at = None
+
+    def encode(self, event_type, data=None):
+        payload = {"type": event_type} if data is None else {"type": event_type, "data": data}
+        self.next_id += 1
+        return f"id: {self.next_id}\ndata: {dumps(payload)}\n\n"
+
+    def add_delta(self, key, event_type, data, flush_at):
+        delta = data if isinstance(data, str) else data["delta"]
+        entry = self.pending.get(key)
+        if entry is None:
+            self.pending[key] = (event_type, data, [delta])
+        else:
+            entry[2].append(delta)
+        self.pending_bytes += len(delta)
+        if self.flush_at is None:
+            self.flush_at = flush_at
+
+    def flush(self):
+        frames = []
+        for event_type, data, deltas in self.pending.values():
+            text = "".join(deltas)
+            frames.append(self.encode(event_type, text if isinstance(data, str) else {**data, "delta": text}))
+        self.pending.clear()
+        self.pending_bytes = 0
+        self.flush_at = None
+        return "".join(frames)
+
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class SSEWriter:
+    """
+    Turns an async iterator of (type, data) events into SSE text. Each yielded
+    string holds one or more frames and is meant to be one write.
+
+    synthesis_chunk and model_chunk deltas are held back (per model) and sent
+    as a single frame once interval seconds passed since the first one, once
+    max_bytes of text are pending, or right before any other event. An
+    interval of 0 sends every delta as it comes. A heartbeat comment is sent
+    when nothing was written for heartbeat seconds.
+    """
+
+    def __init__(self, interval=0.05, max_bytes=1024, heartbeat=15.0):
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.heartbeat = heartbeat
+
+        self.streams = 0
+        self.events = 0
+        self.frames = 0
+        self.writes = 0
+        self.heartbeats = 0
+        self.bytes = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            interval=float(os.getenv("SSE_COALESCE_INTERVAL", "0.05")),
+            max_bytes=int(os.getenv("SSE_COALESCE_BYTES", "1024")),
+            heartbeat=float(os.getenv("SSE_HEARTBEAT", "15")),
+        )
+
+    def encode_all(self, events):
+        """Encode a finished list of events (e.g. a cached stream) in one string."""
+        state = _Frames()
+        return "".join(state.encode(event_type, data) for event_type, data in events)
+
+    def _sent(self, text, frames):
+        self.writes += 1
+        self.frames += frames
+        self.bytes += len(text)
+        sse_writes_total.inc()
+        sse_bytes_total.inc(amount=len(text))
+
+    async def stream(self, events):
+        """Async generator of SSE text for events; runs on the engine loop."""
+        self.streams += 1
+        loop = asyncio.get_running_loop()
+        state = _Frames()
+        buffer = deque()
+        buffered_bytes = 0
+        waiter = None
+
+        def wake():
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+        # Events are read by a separate task so a slow source never delays a
+        # due flush or heartbeat, and a burst is handled in one pass. Deltas
+        # arriving while a flush is already scheduled do not wake the writer.
+        async def pump():
+            nonlocal buffered_bytes
+            try:
+                async for event in events:
+                    buffer.append(event)
+                    if self.interval > 0 and state.flush_at is not None and _delta_key(*event) is not None:
+                        delta = event[1] if isinstance(event[1], str) else event[1]["delta"]
+                        buffered_bytes += len(delta)
+                        if state.pending_bytes + buffered_bytes < self.max_bytes:
+                            continue
+                    wake()
+            except Exception as e:
+                buffer.append(_Failure(e))
+            finally:
+                buffer.append(_DONE)
+                wake()
+
+        reader = asyncio.create_task(pump())
+        last_write = time.monotonic()
+        sse_streams_in_flight.inc()
+        try:
+            while True:
+                if not buffer:
+                    now = time.monotonic()
+                    wait = last_write + self.heartbeat - now
+                    if state.flush_at is not None:
+                        wait = min(wait, state.flush_at - now)
+                    waiter = loop.create_future()
+                    timer = loop.call_later(max(wait, 0), wake)
+                    await waiter
+                    timer.cancel()
+
+                if not buffer:
+                    if state.flush_at is not None and time.monotonic() >= state.flush_at:
+                        frames = len(state.pending)
+                        text = state.flush()
+                    elif time.monotonic() - last_write >= self.heartbeat:
+                        self.heartbeats += 1
+                        frames, text = 0, HEARTBEAT
+                    else:
+                        continue
+                    self._sent(text, frames)
+                    last_write = time.monotonic()
+                    yield text
+                    continue
+
+                parts = []
+                frames = 0
+                finished = False
+                buffered_bytes = 0
+                while buffer:
+                    item = buffer.popleft()
+                    if item is _DONE:
+                        finished = True
+                        break
+                    if isinstance(item, _Failure):
+                        raise item.error
+
+                    event_type, data = item
+                    self.events += 1
+                    key = _delta_key(event_type, data)
+                    if key is not None and self.interval > 0:
+                        state.add_delta(key, event_type, data, time.monotonic() + self.interval)
+                        if state.pending_bytes >= self.max_bytes:
+                            frames += len(state.pending)
+                            parts.append(state.flush())
+                    else:
+                        frames += len(state.pending) + 1
+                        parts.append(state.flush())
+                        parts.append(state.encode(event_type, data))
+
+                if state.pending and (finished or time.monotonic() >= state.flush_at):
+                    frames += len(state.pending)
+                    parts.append(state.flush())
+                if parts:
+                    text = "".join(parts)
+                    self._sent(text, frames)
+                    last_write = time.monotonic()
+                    yield text
+                if finished:
+                    break
+        finally:
+            sse_streams_in_flight.dec()
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "encoder": "orjson" if orjson is not None else "json",
+            "interval_s": self.interval,
+            "max_bytes": self.max_bytes,
+            "streams": self.streams,
+            "events": self.events,
+            "frames": self.frames,
+            "writes": self.writes,
+            "heartbeats": self.heartbeats,
+            "bytes": self.bytes,
+            "events_per_write": round(self.events / self.writes, 2) if self.writes else 0.0,
+        }
+
+
+sse_writer = SSEWriter.from_env()
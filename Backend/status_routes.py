@@ -0,0 +1,81 @@
+from flask import Blueprint, jsonify
+from latency import latency_tracker
+from circuit_breaker import breakers
+from model_selection import model_selector
+from scheduler import model_scheduler
+import engine
+from coalesce import single_flight
+from sse import sse_writer
+from persistence import chat_writer
+from db_connection import pool_stats
+from trial_chat import response_cache, semantic_cache
+from chat_routes import memory_extractor
+from agreement import consensus_policy
+
+status_routes = Blueprint('status', __name__)
+
+
+# Current latency percentiles and adaptive deadline per upstream model
+@status_routes.route('/api/status/latency', methods=['GET'])
+def model_latency():
+    return jsonify({"models": latency_tracker.snapshot()}), 200
+
+
+# Recent outcomes per route, as used by "auto" model selection
+@status_routes.route('/api/status/selection', methods=['GET'])
+def model_selection():
+    return jsonify({"routes": model_selector.snapshot()}), 200
+
+
+# Scheduler queue depth, slot wait times and active calls per provider/model,
+# snapshotted on the engine loop that owns the scheduler
+@status_routes.route('/api/status/scheduler', methods=['GET'])
+def scheduler_stats():
+    return jsonify(engine.call(model_scheduler.stats, timeout=5)), 200
+
+
+# Circuit breaker state per upstream route (closed / open / half_open)
+@status_routes.route('/api/status/breakers', methods=['GET'])
+def circuit_breakers():
+    return jsonify({"routes": breakers.snapshot()}), 200
+
+
+# Hit/miss counters of the trial chat caches, plus the semantic cache's
+# hit-quality report (similarity distribution of hits and closest misses)
+@status_routes.route('/api/status/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "trial_responses": response_cache.stats(),
+        "trial_semantic": semantic_cache.stats(),
+    }), 200
+
+
+# Identical in-flight chat streams that were shared instead of re-run
+@status_routes.route('/api/status/coalescing', methods=['GET'])
+def coalescing_stats():
+    return jsonify(single_flight.stats()), 200
+
+
+# Write-behind queue depth, batch sizes and enqueue-to-commit lag
+@status_routes.route('/api/status/persistence', methods=['GET'])
+def persistence_stats():
+    return jsonify({"chat_writer": chat_writer.stats(), "db_pool": pool_stats()}), 200
+
+
+# Deferred memory extraction: filter skips, batching and call/token savings
+@status_routes.route('/api/status/memory', methods=['GET'])
+def memory_stats():
+    return jsonify(memory_extractor.stats()), 200
+
+
+# SSE encoding: events in vs. frames and writes out after delta coalescing
+@status_routes.route('/api/status/sse', methods=['GET'])
+def sse_stats():
+    return jsonify(sse_writer.stats()), 200
+
+
+# How often agreeing model responses skipped the synthesis call, and the
+# synthesis time that saved (estimated from its median latency)
+@status_routes.route('/api/status/consensus', methods=['GET'])
+def consensus_stats():
+    return jsonify(consensus_policy.stats()), 200
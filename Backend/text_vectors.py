@@ -0,0 +1,135 @@
+import re
+import zlib
+
+import numpy as np
+
+# Local, CPU-only text vectors: hashed word/character n-grams weighted by
+# TF-IDF. No model download and no network; good enough to spot paraphrases
+# and repeated sentences, not a general-purpose embedding.
+
+_WORD = re.compile(r"[a-z0-9]+(?:[+.#-][a-z0-9]+)*")
+
+# Question words (what/who/when/where/why/how/which) are content: "when was
+# X born" and "where was X born" are different questions.
+STOPWORDS = frozenset("""
+a an the and or of to in on at for with by from as is are was were be been being
+it its this that these those i me my you your we our they them he she his her
+do does did can could would should will shall may might must
+there here about into some any just so s
+""".split())
+
+QUESTION_WORDS = frozenset("what which who whom whose how why when where".split())
+
+# Words that phrase a request rather than name its subject: "explain X",
+# "tell me about X", "how does X work" and "the X algorithm" ask about X
+REQUEST_WORDS = frozenset("""
+please tell explain describe define show give work works algorithm concept
+""".split())
+
+
+def words(text):
+    return [w for w in _WORD.findall(text.casefold()) if w not in STOPWORDS]
+
+
+def topic_words(text):
+    """Content words of a prompt without its question and request words, in order."""
+    return [w for w in words(text.replace("-", " ")) if w not in QUESTION_WORDS and w not in REQUEST_WORDS]
+
+
+def question_words(text):
+    return frozenset(w for w in _WORD.findall(text.casefold()) if w in QUESTION_WORDS)
+
+
+def word_overlap(a, b):
+    """
+    Share of the shorter word list's words (and adjacent pairs run together,
+    so "quick sort" meets "quicksort") that the other list also has.
+    """
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    a_terms = set(a) | {left + right for left, right in zip(a, a[1:])}
+    b_terms = set(b) | {left + right for left, right in zip(b, b[1:])}
+    return len(a_terms & b_terms) / min(len(a_terms), len(b_terms))
+
+
+def same_order(a, b):
+    """Whether the words a and b share come in the same order in both."""
+    shared = set(a) & set(b)
+    return list(dict.fromkeys(w for w in a if w in shared)) == list(dict.fromkeys(w for w in b if w in shared))
+
+
+def wording(text):
+    """
+    (content words, adjacent content-word pairs) of text, as frozensets. The
+    pairs carry word order: "celsius to fahrenheit" and its reverse share
+    every word but no pair.
+    """
+    tokens = words(text)
+    return frozenset(tokens), frozenset(zip(tokens, tokens[1:]))
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def numbers(text):
+    """Numeric tokens; prompts that differ only in numbers must never match."""
+    return sorted(w for w in _WORD.findall(text.casefold()) if any(c.isdigit() for c in w))
+
+
+class HashingVectorizer:
+    """
+    Maps texts to raw term-frequency rows of a fixed width. Features are word
+    unigrams and bigrams plus character trigrams of each word (so "sorting"
+    and "sorted" overlap), hashed with crc32 into n_features buckets.
+    """
+
+    def __init__(self, n_features=4096, char_weight=0.5):
+        self.n_features = n_features
+        self.char_weight = char_weight
+
+    def _features(self, text):
+        tokens = words(text)
+        for token in tokens:
+            yield token, 1.0
+            padded = f" {token} "
+            for i in range(len(padded) - 2):
+                yield "#" + padded[i:i + 3], self.char_weight
+        for left, right in zip(tokens, tokens[1:]):
+            yield left + " " + right, 1.0
+
+    def transform(self, texts):
+        """Sublinear (1 + log tf) term frequencies, shape (len(texts), n_features)."""
+        rows = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = list(self._features(text))
+            if not features:
+                continue
+            # One bincount per text instead of a NumPy item write per feature
+            buckets = [zlib.crc32(feature.encode()) % self.n_features for feature, _ in features]
+            rows[row] = np.bincount(buckets, [weight for _, weight in features], self.n_features)
+        np.log1p(rows, out=rows)
+        return rows
+
+
+def idf(df, n_docs):
+    """Smoothed inverse document frequency."""
+    return np.log((1.0 + n_docs) / (1.0 + df)).astype(np.float32) + 1.0
+
+
+def normalize(rows):
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return rows / norms
+
+
+def tfidf(rows):
+    """TF-IDF rows with document frequencies taken from the batch itself."""
+    weights = idf((rows > 0).sum(axis=0), len(rows))
+    return normalize(rows * weights)
+
+
+def cosine_matrix(rows):
+    """Pairwise cosine similarity of a batch of texts' TF-IDF vectors."""
+    vectors = tfidf(rows)
+    return vectors @ vectors.T
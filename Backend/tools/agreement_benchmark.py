@@ -0,0 +1,59 @@
+import os, random, statistics, sys, time
+
+# CPU cost per request of collapse_shared_sentences() on a five-model
+# ensemble. Responses are synthetic: each model restates a share of a common
+# pool of facts with small wording changes and adds facts of its own.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agreement import collapse_shared_sentences
+
+MODELS = ["DeepSeek", "Llama", "GLM", "Essential", "Moonshot"]
+SENTENCES_PER_RESPONSE = [10, 30, 60]
+OVERLAP = 0.5
+RUNS = 20
+WORDS = ("pivot partition array element recursion stable merge quicksort sorted heap "
+         "worst case average complexity memory swap index left right linear logarithmic "
+         "comparison buffer cache branch input output").split()
+
+
+def fact(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16)))
+
+
+def restate(sentence, rng):
+    # Light paraphrase: swap case of the opener and sometimes add a filler
+    words = sentence.split()
+    if rng.random() < 0.5:
+        words.insert(rng.randrange(len(words)), rng.choice(["usually", "generally", "also"]))
+    return " ".join(words).capitalize() + "."
+
+
+def ensemble(n, rng):
+    pool = [fact(rng) for _ in range(n)]
+    responses = []
+    for model in MODELS:
+        sentences = [
+            restate(rng.choice(pool), rng) if rng.random() < OVERLAP else fact(rng).capitalize() + "."
+            for _ in range(n)
+        ]
+        responses.append({"model": model, "response": " ".join(sentences)})
+    return responses
+
+
+def main():
+    rng = random.Random(5)
+    print("sentences_per_response, p50_ms, p95_ms, shared_lines, removed, tokens_saved")
+    for n in SENTENCES_PER_RESPONSE:
+        timings, report = [], None
+        for _ in range(RUNS):
+            responses = ensemble(n, rng)
+            start = time.process_time()
+            _, _, report = collapse_shared_sentences(responses)
+            timings.append((time.process_time() - start) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"- {n}, {statistics.median(timings):.2f}, {p95:.2f}, "
+              f"{report['shared']}, {report['removed']}, {report['tokens_saved']}")
+
+
+if __name__ == "__main__":
+    main()
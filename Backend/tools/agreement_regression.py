@@ -0,0 +1,71 @@
+import os, sys
+
+# Sentence pairs collapse_shared_sentences() must (and must not) treat as one
+# statement when two models make them, and response sets the consensus policy
+# must (and must not) answer without synthesis. Exits non-zero on any mismatch.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agreement import ConsensusPolicy, collapse_shared_sentences
+
+MUST_SHARE = [
+    ("Quicksort picks a pivot element and partitions the array around it.",
+     "Quicksort selects a pivot element and partitions the array around it."),
+    ("Divide-and-conquer splits the input into halves.",
+     "Divide and conquer splits the input into halves."),
+    ("Merge sort is a stable sorting algorithm with predictable performance.",
+     "Merge sort is a stable sorting algorithm with very predictable performance."),
+]
+MUST_KEEP = [
+    ("Heat the oven to 200 degrees before baking the bread.",
+     "Cool the oven to 200 degrees before baking the bread."),
+    ("Earth orbits the Sun once every year.", "The Sun orbits Earth once every year."),
+    ("Python is faster than Java for scripting tasks.", "Java is faster than Python for scripting tasks."),
+    ("Quicksort is a stable sorting algorithm in practice.", "Quicksort is not a stable sorting algorithm in practice."),
+    ("The array holds 10 elements after the first pass.", "The array holds 12 elements after the first pass."),
+]
+
+MUST_FIRE = [
+    ["Paris.", "Paris.", "Paris."],
+    ["The capital of France is Paris.", "The capital of France is Paris!"],
+    ["Water boils at 100 degrees Celsius at sea level.", "Water boils at 100 degrees Celsius at sea level."],
+]
+MUST_NOT_FIRE = [
+    ["The largest planet is Jupiter.", "The largest planet is Saturn."],
+    ["Earth orbits the Sun.", "The Sun orbits Earth."],
+    ["The answer is 42.", "The answer is 41."],
+    ["Paris.", "Paris.", "Lyon."],
+]
+
+
+def shared(first, second):
+    _, lines, _ = collapse_shared_sentences([
+        {"model": "A", "response": first},
+        {"model": "B", "response": second},
+    ])
+    return bool(lines)
+
+
+def fires(answers):
+    pick, _ = ConsensusPolicy().check([{"model": f"m{i}", "response": a} for i, a in enumerate(answers)])
+    return pick is not None
+
+
+def main():
+    failures = 0
+    print("expected, got, first, second")
+    for expected, pairs in (("shared", MUST_SHARE), ("kept", MUST_KEEP)):
+        for first, second in pairs:
+            got = "shared" if shared(first, second) else "kept"
+            failures += got != expected
+            print(f"- {expected}, {got}, {first!r}, {second!r}")
+    print("expected, got, responses")
+    for expected, cases in (("consensus", MUST_FIRE), ("synthesis", MUST_NOT_FIRE)):
+        for answers in cases:
+            got = "consensus" if fires(answers) else "synthesis"
+            failures += got != expected
+            print(f"- {expected}, {got}, {answers!r}")
+    print(f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import asyncio, concurrent.futures, os, sys, threading, time
+from typing import List
+
+# Compares concurrent /api/chat capacity of the old thread-per-model fan-out
+# against the asyncio engine. Upstream calls are simulated with sleeps, so no
+# network or HF_TOKEN is needed. Each request still gets one consumer thread,
+# standing in for the WSGI worker thread that drains the SSE generator.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import engine
+
+MODEL_LATENCIES_S: List[float] = [0.4, 0.6, 0.8, 1.0, 1.2]  # 5-model fan-out
+SYNTHESIS_S = 0.5
+CONCURRENCY = [10, 50, 100, 200]
+
+
+def thread_request():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(time.sleep, s) for s in MODEL_LATENCIES_S]
+        for f in concurrent.futures.as_completed(futures, timeout=120):
+            f.result()
+            yield "data: model_response\n\n"
+    time.sleep(SYNTHESIS_S)
+    yield "data: done\n\n"
+
+
+def async_request():
+    async def generate():
+        tasks = [asyncio.create_task(asyncio.sleep(s)) for s in MODEL_LATENCIES_S]
+        for next_done in asyncio.as_completed(tasks, timeout=120):
+            await next_done
+            yield "data: model_response\n\n"
+        await asyncio.sleep(SYNTHESIS_S)
+        yield "data: done\n\n"
+
+    yield from engine.stream(generate())
+
+
+def run(make_request, concurrency):
+    peak = threading.active_count()
+    stop = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not stop.is_set():
+            peak = max(peak, threading.active_count())
+            time.sleep(0.01)
+
+    monitor = threading.Thread(target=sample, daemon=True)
+    monitor.start()
+
+    def consume():
+        for _ in make_request():
+            pass
+
+    start = time.time()
+    workers = [threading.Thread(target=consume) for _ in range(concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.time() - start
+
+    stop.set()
+    monitor.join()
+    return {"wall_s": round(wall, 3), "peak_threads": peak, "req_per_s": round(concurrency / wall, 1)}
+
+
+def main():
+    engine.get_loop()  # start the engine thread outside the measurement
+    ideal = max(MODEL_LATENCIES_S) + SYNTHESIS_S
+    print(f"Ideal per-request latency: {ideal:.2f}s\n")
+    print("mode, concurrent, wall_s, peak_threads, req_per_s")
+    for n in CONCURRENCY:
+        for mode, fn in (("threads", thread_request), ("asyncio", async_request)):
+            res = run(fn, n)
+            print(f"- {mode}, {n}, {res['wall_s']}, {res['peak_threads']}, {res['req_per_s']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os, sys, threading, time
+
+# Per-call cost of the /metrics instrumentation on the hot path (counter
+# increments and histogram observations, single-threaded and from several
+# threads at once), and the time to render a scrape with a realistic number
+# of series.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import MetricsRegistry
+
+CALLS = 200_000
+THREADS = 8
+ROUTES = [f"provider-{p}/model-{m}" for p in range(4) for m in range(6)]
+OUTCOMES = ("ok", "empty", "error", "timeout")
+
+
+def per_call_ns(fn, calls):
+    start = time.perf_counter()
+    fn(calls)
+    return (time.perf_counter() - start) * 1e9 / calls
+
+
+def main():
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_calls_total", "calls", ("route", "outcome"))
+    histogram = registry.histogram("bench_call_seconds", "latency", ("route",))
+    unlabeled = registry.counter("bench_bytes_total", "bytes")
+
+    def inc_unlabeled(n):
+        for _ in range(n):
+            unlabeled.inc(amount=100)
+
+    def inc_labeled(n):
+        for i in range(n):
+            counter.inc(ROUTES[i % len(ROUTES)], OUTCOMES[i % len(OUTCOMES)])
+
+    def observe(n):
+        for i in range(n):
+            histogram.observe((i % 1000) / 100, ROUTES[i % len(ROUTES)])
+
+    def empty_loop(n):
+        for i in range(n):
+            ROUTES[i % len(ROUTES)]
+
+    baseline = per_call_ns(empty_loop, CALLS)
+    print("operation, ns_per_call (loop overhead subtracted)")
+    for name, fn in (("counter.inc unlabeled", inc_unlabeled), ("counter.inc 2 labels", inc_labeled),
+                     ("histogram.observe", observe)):
+        print(f"- {name}, {per_call_ns(fn, CALLS) - baseline:.0f}")
+
+    threads = [threading.Thread(target=observe, args=(CALLS // THREADS,)) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"- histogram.observe, {THREADS} threads, {(time.perf_counter() - start) * 1e9 / CALLS:.0f}")
+
+    start = time.perf_counter()
+    text = registry.render()
+    series = len(ROUTES) * len(OUTCOMES) + len(ROUTES) + 1
+    print(f"render: {series} series, {len(text.splitlines())} lines, {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os, random, re, sys, time
+
+# Cost of the streaming RepetitionFilter on long degenerate synthesis output,
+# fed in small token-sized deltas, next to the old post-hoc strip_repetition
+# over the finished text. Texts are synthetic; time per char should stay
+# flat as the size grows.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repetition import RepetitionFilter
+
+SIZES = [10_000, 100_000, 1_000_000]
+DELTA_CHARS = 4
+WORDS = ("pivot partition array element recursion stable merge quicksort sorted "
+         "worst case average complexity memory swap index left right").split()
+
+
+def post_hoc(text):
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    seen = set()
+    output = []
+    for s in sentences:
+        key = s.lower().strip()
+        if key not in seen:
+            seen.add(key)
+            output.append(s)
+    return " ".join(output)
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize() + "."
+
+
+def text_of(kind, size, rng):
+    if kind == "looping sentence":
+        unit = sentence(rng) + " "
+    elif kind == "looping paragraph":
+        unit = " ".join(sentence(rng) for _ in range(6)) + "\n\n"
+    else:  # no repeats
+        parts, length = [], 0
+        while length < size:
+            parts.append(sentence(rng) + (" " if rng.random() < 0.8 else "\n"))
+            length += len(parts[-1])
+        return "".join(parts)[:size]
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+def main():
+    rng = random.Random(3)
+    print("text, chars, stream_ms, stream_ns_per_char, dropped, post_hoc_ms")
+    for kind in ("looping sentence", "looping paragraph", "no repeats"):
+        for size in SIZES:
+            text = text_of(kind, size, rng)
+            deltas = [text[i:i + DELTA_CHARS] for i in range(0, len(text), DELTA_CHARS)]
+
+            repetition_filter = RepetitionFilter()
+            start = time.perf_counter()
+            for delta in deltas:
+                repetition_filter.feed(delta)
+            repetition_filter.flush()
+            stream_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            post_hoc(text)
+            post_hoc_s = time.perf_counter() - start
+
+            print(f"- {kind}, {size}, {stream_s * 1000:.2f}, {stream_s * 1e9 / size:.0f}, "
+                  f"{repetition_filter.dropped}, {post_hoc_s * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os, random, sys, time
+
+# Lookup cost of the trial chat SemanticCache at full capacity, one prompt at
+# a time vs. a single batched get_many() call. Prompts are synthetic.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import SemanticCache
+
+TOPICS = ["quicksort", "mergesort", "binary search", "recursion", "photosynthesis", "black holes",
+          "the french revolution", "python decorators", "tcp handshakes", "compound interest"]
+FRAMES = ["explain {}", "how does {} work", "give me an overview of {}", "what is {} used for",
+          "write a short poem about {}", "summarize {} for a beginner"]
+CAPACITY = [256, 1024, 4096]
+QUERIES = 256
+
+
+def prompt(rng):
+    return rng.choice(FRAMES).format(rng.choice(TOPICS)) + f" variant {rng.randrange(10**6)}"
+
+
+def main():
+    rng = random.Random(7)
+    print("capacity, single_ms_per_lookup, batch_ms_per_lookup, put_ms")
+    for capacity in CAPACITY:
+        cache = SemanticCache(capacity=capacity)
+        start = time.perf_counter()
+        for _ in range(capacity):
+            cache.put(prompt(rng), None, namespace="bench")
+        put_ms = (time.perf_counter() - start) * 1000 / capacity
+
+        queries = [prompt(rng) for _ in range(QUERIES)]
+        start = time.perf_counter()
+        for q in queries:
+            cache.get(q, namespace="bench")
+        single_ms = (time.perf_counter() - start) * 1000 / QUERIES
+
+        start = time.perf_counter()
+        cache.get_many(queries, namespace="bench")
+        batch_ms = (time.perf_counter() - start) * 1000 / QUERIES
+
+        print(f"- {capacity}, {single_ms:.3f}, {batch_ms:.3f}, {put_ms:.3f}")
+
+
+if __name__ == "__main__":
+    main()
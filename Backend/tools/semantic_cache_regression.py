@@ -0,0 +1,50 @@
+import os, sys
+
+# Prompt pairs the trial chat SemanticCache must (and must not) treat as the
+# same question, at its default threshold. Exits non-zero on any mismatch.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import SemanticCache
+
+MUST_MISS = [
+    ("when was Abraham Lincoln born", "where was Abraham Lincoln born"),
+    ("why do cats purr", "how do cats purr"),
+    ("who invented the telephone", "when was the telephone invented"),
+    ("convert celsius to fahrenheit", "convert fahrenheit to celsius"),
+    ("Is Python faster than Java?", "Is Java faster than Python?"),
+    ("what is 2 + 2", "what is 2 + 3"),
+    ("explain quicksort", "explain mergesort"),
+    ("benefits of python", "benefits of python decorators"),
+    ("how to reverse a linked list in python", "how to reverse a linked list in rust"),
+]
+MUST_HIT = [
+    ("explain quicksort", "how does quicksort work"),
+    ("explain quicksort", "what is quicksort"),
+    ("explain quicksort", "explain quick sort"),
+    ("explain quicksort", "explain the quicksort algorithm"),
+    ("Explain quicksort", "please explain quicksort"),
+    ("When was Abraham Lincoln born?", "when was abraham lincoln born"),
+    ("how do cats purr", "Can you tell me how do cats purr?"),
+    ("convert celsius to fahrenheit", "Convert Celsius to Fahrenheit, please."),
+]
+
+
+def check(first, second):
+    cache = SemanticCache()
+    cache.put(first, "cached", namespace="regression")
+    return cache.get(second, namespace="regression") is not None
+
+
+def main():
+    failures = 0
+    print("expected, got, first, second")
+    for expected, pairs in (("miss", MUST_MISS), ("hit", MUST_HIT)):
+        for first, second in pairs:
+            got = "hit" if check(first, second) else "miss"
+            failures += got != expected
+            print(f"- {expected}, {got}, {first!r}, {second!r}")
+    print(f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
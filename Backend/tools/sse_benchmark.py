@@ -0,0 +1,67 @@
+import asyncio, json, os, sys, threading, time
+
+# Server-side cost of streaming one synthesis: the old json.dumps-per-token
+# frames vs. SSEWriter with delta coalescing. Tokens are synthetic; each
+# stream pushes TOKENS synthesis_chunk deltas, either as fast as possible
+# (encoding throughput) or paced at TOKEN_INTERVAL_S like a real model. As in
+# the routes, every stream is drained through engine.stream by its own
+# thread, standing in for the WSGI worker that writes to the socket.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import engine
+from sse import SSEWriter, orjson
+
+TOKENS = 2000
+TOKEN_INTERVAL_S = 0.002
+PACED_STREAMS = 20
+
+
+async def events(paced):
+    for i in range(TOKENS):
+        if paced:
+            await asyncio.sleep(TOKEN_INTERVAL_S)
+        yield "synthesis_chunk", f" token{i % 97}"
+    yield "synthesis_done", {"models": ["DeepSeek", "Llama"]}
+    yield "done", None
+
+
+async def per_token(paced):
+    async for event_type, data in events(paced):
+        payload = {"type": event_type} if data is None else {"type": event_type, "data": data}
+        yield f"data: {json.dumps(payload)}\n\n"
+
+
+def consume(stream, results):
+    writes = frames = size = 0
+    for text in engine.stream(stream):
+        writes += 1
+        frames += text.count("\n\n")
+        size += len(text)
+    results.append((writes, frames, size))
+
+
+def measure(name, make_stream, streams):
+    results = []
+    workers = [threading.Thread(target=consume, args=(make_stream(), results)) for _ in range(streams)]
+    cpu, wall = time.process_time(), time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    writes, frames, size = results[0]
+    print(f"- {name}, {writes}, {frames}, {size}, {frames * streams / wall:,.0f}, {cpu * 1000 / streams:.2f}")
+
+
+def main():
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}; {TOKENS} tokens per stream")
+    print("mode, writes_per_stream, frames_per_stream, bytes_per_stream, frames_per_s, cpu_ms_per_stream")
+    for paced, streams in ((False, 1), (True, PACED_STREAMS)):
+        label = "paced" if paced else "burst"
+        measure(f"{label} per-token", lambda: per_token(paced), streams)
+        for interval in (0, 0.02, 0.05):
+            writer = SSEWriter(interval=interval, max_bytes=1024)
+            measure(f"{label} writer {interval * 1000:g}ms", lambda: writer.stream(events(paced)), streams)
+
+
+if __name__ == "__main__":
+    main()
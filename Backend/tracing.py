@@ -0,0 +1,223 @@
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from flask import g, request
+from sse import dumps
+import contextvars
+import itertools
+import os
+import re
+import threading
+import time
+import uuid
+
+load_dotenv()
+
+# Per-request phase tracing. A Trace is created for every request of a
+# blueprint passed to install() and made current through a context variable,
+# so tasks and asyncio.to_thread() workers started while handling the
+# request record into it. Spans show up as a Server-Timing header and, on
+# streaming routes, as a final "timing" event.
+
+# Optional JSONL log, one finished trace per line. Spans carry their parent's
+# id, so stacks can be folded for flame-style analysis.
+TRACE_LOG = os.getenv("TRACE_LOG", "")
+
+_current = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("trace_parent", default=None)
+
+# Server-Timing metric names are tokens; the rest goes into desc
+_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+_DESC_KEYS = ("model", "route")
+
+_log_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("trace", "id", "parent", "name", "start", "ms", "attrs")
+
+    def __init__(self, trace, span_id, parent, name, attrs):
+        self.trace = trace
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.start = time.perf_counter()
+        self.ms = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self):
+        if self.ms is None:
+            self.ms = (time.perf_counter() - self.start) * 1000
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.start) * 1000, 3),
+            "ms": round(self.ms, 3) if self.ms is not None else None,
+            **self.attrs,
+        }
+
+
+class _NoSpan:
+    """Stands in for a span when no trace is active."""
+
+    def set(self, **attrs):
+        pass
+
+    def end(self):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """
+    Spans of one request. A span's parent is the span open around it in the
+    same task (or the task that started it); spans begun with begin() in an
+    async generator are not parents, since the generator may be resumed
+    from elsewhere.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.finished = False
+        self._ids = itertools.count(1)
+
+    def begin(self, name, **attrs):
+        if self.finished:
+            return _NO_SPAN
+        parent = _parent.get()
+        span = Span(self, next(self._ids), parent.id if parent is not None and parent.trace is self else None,
+                    name, attrs)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = self.begin(name, **attrs)
+        if span is _NO_SPAN:
+            yield span
+            return
+        token = _parent.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            _parent.reset(token)
+            span.end()
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        entries = []
+        for span in self.spans:
+            if span.ms is None:
+                continue
+            entry = f"{_NAME.sub('_', span.name)};dur={span.ms:.1f}"
+            desc = " ".join(str(span.attrs[key]) for key in _DESC_KEYS if key in span.attrs)
+            if desc:
+                entry += ';desc="' + desc.replace("\\", "\\\\").replace('"', '\\"') + '"'
+            entries.append(entry)
+        entries.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(entries)
+
+    def report(self):
+        return {
+            "trace_id": self.id,
+            "total_ms": round(self.total_ms(), 3),
+            "spans": [span.as_dict() for span in self.spans],
+        }
+
+    def finish(self):
+        """Close the trace, append it to TRACE_LOG if set, and return its report."""
+        report = self.report()
+        if self.finished:
+            return report
+        self.finished = True
+        if TRACE_LOG:
+            line = dumps({"name": self.name, "started_at": round(self.started_at, 6), **report})
+            try:
+                with _log_lock, open(TRACE_LOG, "a", encoding="utf-8") as log:
+                    log.write(line + "\n")
+            except OSError as e:
+                print(f"[tracing] Span log write failed: {e}")
+        return report
+
+
+def current():
+    return _current.get()
+
+
+def activate(trace):
+    """Make trace current for the running task (e.g. at the top of a stream)."""
+    _current.set(trace)
+    return trace
+
+
+def traced(coro):
+    """
+    Wrap coro so it records into the calling thread's trace and open span;
+    for coroutines handed to engine.run(), which start with a fresh context.
+    """
+    trace, parent = _current.get(), _parent.get()
+
+    async def run():
+        _current.set(trace)
+        _parent.set(parent)
+        return await coro
+
+    return run()
+
+
+def span(name, **attrs):
+    """Context manager recording a span into the current trace, if any."""
+    trace = _current.get()
+    return trace.span(name, **attrs) if trace is not None else _no_span()
+
+
+@contextmanager
+def _no_span():
+    yield _NO_SPAN
+
+
+def begin(name, **attrs):
+    """Start a span that is ended explicitly with .end(), for async generators."""
+    trace = _current.get()
+    return trace.begin(name, **attrs) if trace is not None else _NO_SPAN
+
+
+def install(blueprint):
+    """Trace every request of blueprint and add a Server-Timing header."""
+
+    @blueprint.before_request
+    def start_trace():
+        g.trace = Trace(request.endpoint)
+        g.trace_token = _current.set(g.trace)
+
+    @blueprint.after_request
+    def add_server_timing(response):
+        trace = g.get("trace")
+        if trace is not None:
+            # Streams finish their trace in a final "timing" event instead
+            response.headers["Server-Timing"] = trace.server_timing()
+            if not response.is_streamed:
+                trace.finish()
+        return response
+
+    @blueprint.teardown_request
+    def end_trace(error):
+        token = g.pop("trace_token", None)
+        if token is not None:
+            _current.reset(token)
@@ -1,46 +1,28 @@
 from flask import Blueprint, request, jsonify, Response
+from ensemble import (DEFAULT_MODELS, call_model, check_consensus, fan_out, fanout_timeout, merge,
+                      parse_ensemble_options, prepare_synthesis, quorum_reached)
+from cache import SemanticCache, TTLCache
+from coalesce import single_flight
+from sse import sse_writer
+from repetition import strip_repetition
+from model_selection import model_selector
+from metrics import synthesis_seconds, synthesis_total
+import engine
+import tracing
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
-import concurrent.futures
-import json
 import time
-import re
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
 
 load_dotenv()
 
 trial_chat_routes = Blueprint('trials', __name__)
-
-def strip_repetition(text, min_repeat_len=20):
-    if not text or len(text) < min_repeat_len * 2:
-        return text
-
-    sentences = re.split(r'(?<=[.!?])\s+', text.strip())
-    if len(sentences) <= 2:
-        return text
-
-    seen = set()
-    unique = []
-    repeats = 0
-
-    for s in sentences:
-        norm = s.strip().lower()
-        if norm in seen:
-            repeats += 1
-        else:
-            seen.add(norm)
-            unique.append(s)
-
-    if repeats > len(sentences) * 0.3:
-        return " ".join(unique)
-
-    return text
-
+tracing.install(trial_chat_routes)
 
 # -------------------------
 # OpenAI client via HF router
 # -------------------------
-client = OpenAI(
+client = AsyncOpenAI(
     base_url="https://router.huggingface.co/v1",
     api_key=os.environ.get("HF_TOKEN"),
 )
@@ -52,15 +34,78 @@ MODEL_CONFIGS = {
     "deepseek": {
         "label": "DeepSeek",
         "hf_model": "deepseek-ai/DeepSeek-V3.2:novita",
+        "fallback": "deepseek-ai/DeepSeek-V3.2:together",
     },
     "llama": {
         "label": "Llama",
         "hf_model": "meta-llama/Llama-3.1-8B-Instruct:novita",
+        "fallback": "meta-llama/Llama-3.1-8B-Instruct:together",
     },
 }
 
 VALID_MODELS = set(MODEL_CONFIGS.keys())
 
+# Trial chat has no user memory, so identical prompts get identical answers.
+# Events of fully successful streams are cached and replayed (minus
+# model_chunk deltas).
+response_cache = TTLCache(
+    max_entries=int(os.getenv("TRIAL_CACHE_SIZE", "512")),
+    ttl=int(os.getenv("TRIAL_CACHE_TTL", "3600")),
+)
+
+
+# Paraphrases ("explain quicksort" / "how does quicksort work") are served
+# from a TF-IDF similarity index over the same cached streams; see
+# tools/semantic_cache_regression.py for pairs that must hit and miss.
+semantic_cache = SemanticCache(
+    capacity=int(os.getenv("SEMANTIC_CACHE_SIZE", "1024")),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85")),
+    ttl=int(os.getenv("TRIAL_CACHE_TTL", "3600")),
+)
+
+
+def response_cache_key(message, models, synthesize, min_for_synthesis, quorum, soft_deadline):
+    """
+    Everything that shapes a stream. The synthesis options decide whether it
+    runs and over which responses, so they are part of the key when it does.
+    """
+    normalized = " ".join(message.casefold().split())
+    synthesis = (min_for_synthesis, quorum, soft_deadline) if synthesize else None
+    return (normalized, tuple(sorted(set(models))), bool(synthesize), synthesis)
+
+
+def build_synthesis_prompt(base_message, included, shared=()):
+    formatted = "\n".join(
+        f"===== {r['model']} =====\n{r['response']}\n"
+        for r in included
+    )
+    if shared:
+        # Statements several models made, collapsed into one line each
+        formatted = "===== Shared =====\n" + "\n".join(f"- {line}" for line in shared) + "\n\n" + formatted
+
+    return f"""
+You are synthesizing multiple AI responses into ONE correct answer.
+
+USER QUESTION:
+{base_message}
+
+MODEL RESPONSES:
+{formatted}
+
+RULES:
+- Use only information from the model responses
+- Resolve conflicts logically
+- Do not invent facts
+
+OUTPUT FORMAT:
+
+===REASONING===
+(short explanation)
+
+===ANSWER===
+(final answer)
+"""
+
 
 # -------------------------
 # API Route
@@ -75,166 +120,267 @@ def trial_chat():
             return jsonify({"error": "Message cannot be empty"}), 400
 
         user_message = base_message + "\n\nRespond in English only."
+        user_key = f"ip:{request.remote_addr}"
 
-        selected_models = data.get("models", list(VALID_MODELS))
+        enable_synthesis = data.get("synthesize", True)
+        try:
+            min_for_synthesis, quorum, soft_deadline, latency_budget = parse_ensemble_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        requested_models = data.get("models", DEFAULT_MODELS)
+        selection = None
+        if requested_models == "auto":
+            with tracing.span("selection"):
+                selected_models, selection = model_selector.select(
+                    MODEL_CONFIGS,
+                    budget_s=latency_budget,
+                    min_models=max(model_selector.min_models, min_for_synthesis if enable_synthesis else 0),
+                )
+        elif requested_models == "all":
+            selected_models = list(MODEL_CONFIGS)
+        else:
+            selected_models = requested_models
         selected_models = [m for m in selected_models if m in VALID_MODELS][:4]
 
         if not selected_models:
             return jsonify({"error": "No valid models selected"}), 400
 
-        enable_synthesis = data.get("synthesize", True)
-        min_for_synthesis = max(1, int(data.get("min_for_synthesis", 2)))
+        sse_headers = {
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+
+        cache_key = response_cache_key(
+            base_message, selected_models, enable_synthesis, min_for_synthesis, quorum, soft_deadline
+        )
+        with tracing.span("cache"):
+            cached = response_cache.get(cache_key)
+        if cached is not None:
+            return Response(
+                sse_writer.encode_all(cached),
+                mimetype="text/event-stream",
+                headers={**sse_headers, "X-Cache": "HIT"},
+            )
+
+        with tracing.span("semantic_cache"):
+            similar = semantic_cache.get(base_message, namespace=cache_key[1:])
+        if similar is not None:
+            events, similarity, cached_prompt = similar
+            print(f"[trial] Semantic cache hit ({similarity:.3f}): {base_message!r} ~ {cached_prompt!r}")
+            notice = ("cache", {"match": "semantic", "similarity": round(similarity, 4)})
+            return Response(
+                sse_writer.encode_all((notice, *events)),
+                mimetype="text/event-stream",
+                headers={**sse_headers, "X-Cache": "SEMANTIC-HIT"},
+            )
+
+        replay = []  # every event except model_chunk, kept for the cache
+        cacheable = True
 
         # -------------------------
         # Model invocation
         # -------------------------
-        def invoke_model(cfg):
-            def call_once():
-                start = time.time()
-                completion = client.chat.completions.create(
-                    model=cfg["hf_model"],
-                    messages=[{"role": "user", "content": user_message}],
-                    timeout=90,
-                )
-                text = completion.choices[0].message.content
-                if not text or not text.strip():
-                    raise ValueError("Empty response")
-                return text, time.time() - start
-
+        async def invoke_model(cfg, on_chunk):
+            # Failed or circuit-broken routes fall back to cfg["fallback"]
+            # inside call_model instead of blindly retrying the same provider
             try:
-                response, elapsed = call_once()
-                print(f"[{cfg['label']}] OK ({elapsed:.2f}s)")
+                with tracing.span("model", model=cfg["label"]):
+                    response, elapsed, route = await call_model(
+                        client,
+                        user_key,
+                        cfg["hf_model"],
+                        [{"role": "user", "content": user_message}],
+                        on_chunk=on_chunk,
+                        fallback=cfg.get("fallback"),
+                    )
+                if not response or not response.strip():
+                    raise ValueError("Empty response")
+            except Exception as e:
+                print(f"[{cfg['label']}] Failed: {e}")
                 return {
                     "model": cfg["label"],
-                    "response": response,
-                    "success": True,
-                    "elapsed": elapsed,
+                    "success": False,
+                    "error": str(e),
                 }
-            except Exception as e:
-                print(f"[{cfg['label']}] Retry after error: {e}")
-                try:
-                    time.sleep(0.3)
-                    response, elapsed = call_once()
-                    return {
-                        "model": cfg["label"],
-                        "response": response,
-                        "success": True,
-                        "elapsed": elapsed,
-                        "retried": True,
-                    }
-                except Exception as e2:
-                    return {
-                        "model": cfg["label"],
-                        "success": False,
-                        "error": str(e2),
-                    }
+
+            print(f"[{cfg['label']}] OK ({elapsed:.2f}s via {route})")
+            result = {
+                "model": cfg["label"],
+                "response": response,
+                "success": True,
+                "elapsed": elapsed,
+            }
+            if route != cfg["hf_model"]:
+                result["route"] = route
+            return result
 
         # -------------------------
-        # Streaming generator (SSE)
+        # Synthesis step
         # -------------------------
-        def generate():
-            successful = []
-            failed = []
-
-            with concurrent.futures.ThreadPoolExecutor(
-                max_workers=len(selected_models)
-            ) as executor:
-                futures = {
-                    executor.submit(invoke_model, MODEL_CONFIGS[m]): m
-                    for m in selected_models
-                }
-
-                for future in concurrent.futures.as_completed(futures):
-                    result = future.result()
-                    if result.get("success"):
-                        successful.append(result)
-                        payload = {
-                            "type": "model_response",
-                            "data": result,
-                        }
-                        yield f"data: {json.dumps(payload)}\n\n"
-                    else:
-                        failed.append(result)
-                        print("[MODEL FAILED]", result.get("error"))
-
-            # -------------------------
-            # Synthesis step
-            # -------------------------
-            if enable_synthesis and len(successful) >= min_for_synthesis:
-                formatted = "\n".join(
-                    f"===== {r['model']} =====\n{r['response']}\n"
-                    for r in successful
+        async def synthesize(included):
+            nonlocal cacheable
+            # Models that all said the same thing need no synthesis call
+            pick, consensus = check_consensus(included)
+            if pick is not None:
+                print(f"[trial] Consensus, synthesis skipped: {consensus}")
+                synthesis_total.inc("trial", "consensus")
+                event = ("synthesis", {
+                    "model": pick["model"],
+                    "response": pick["response"],
+                    "models": [r["model"] for r in included],
+                    "synthesis_source": "consensus",
+                    "consensus": consensus,
+                })
+                replay.append(event)
+                yield event
+                return
+
+            synthesis_prompt, prompt_report = await prepare_synthesis(
+                included, lambda responses, shared: build_synthesis_prompt(base_message, responses, shared)
+            )
+            yield "synthesis_prompt", prompt_report
+
+            start = time.perf_counter()
+            span = tracing.begin("synthesis", prompt_tokens=prompt_report["tokens_after"])
+            try:
+                completion_text, _, _ = await call_model(
+                    client,
+                    user_key,
+                    "openai/gpt-oss-20b:novita",
+                    [{"role": "user", "content": synthesis_prompt}],
+                    fallback="openai/gpt-oss-20b:together",
+                    max_tokens=1500,
+                    frequency_penalty=1.2,
                 )
 
-                synthesis_prompt = f"""
-You are synthesizing multiple AI responses into ONE correct answer.
+                # Not streamed, so there is no separate time to first token
+                span.end()
+                synthesis_seconds.observe(time.perf_counter() - start, "trial")
+                synthesis_total.inc("trial", "llm")
+                synthesis_text = strip_repetition(completion_text)
+
+                event = ("synthesis", {
+                    "model": "GPT-OSS",
+                    "response": synthesis_text,
+                    "models": [r["model"] for r in included],
+                    "synthesis_source": "llm",
+                })
+                replay.append(event)
+                yield event
 
-USER QUESTION:
-{base_message}
-
-MODEL RESPONSES:
-{formatted}
-
-RULES:
-- Use only information from the model responses
-- Resolve conflicts logically
-- Do not invent facts
-
-OUTPUT FORMAT:
-
-===REASONING===
-(short explanation)
+            except Exception as e:
+                span.set(error=type(e).__name__)
+                span.end()
+                cacheable = False
+                yield "synthesis", {
+                    "model": "GPT-OSS",
+                    "error": True,
+                    "response": str(e),
+                }
 
-===ANSWER===
-(final answer)
-"""
+        # -------------------------
+        # Streaming generator (SSE)
+        # -------------------------
+        def model_event(kind, label, result, late=False):
+            nonlocal cacheable
+            if kind == "chunk":
+                event = ("model_chunk", {"model": label, "delta": result})
+            elif kind == "result" and result.get("success"):
+                if late:
+                    result = {**result, "excluded_from_synthesis": True}
+                event = ("model_response", result)
+            else:
+                if kind == "result":
+                    print("[MODEL FAILED]", result.get("error"))
+                if kind in ("result", "error", "timeout"):
+                    cacheable = False
+                return None
+
+            if kind != "chunk":
+                replay.append(event)
+            return event
+
+        async def late_responses(fan):
+            # Models that finish after synthesis started still reach the client
+            async for kind, label, result in fan:
+                event = model_event(kind, label, result, late=True)
+                if event:
+                    yield event
+
+        trace = tracing.current()
+
+        async def generate():
+            tracing.activate(trace)
+            successful = []
+            finished = 0
+            deadline_passed = False
 
-                try:
-                    completion = client.chat.completions.create(
-                        model="openai/gpt-oss-20b:novita",
-                        messages=[{"role": "user", "content": synthesis_prompt}],
-                        max_tokens=1500,
-                        timeout=90,
-                        frequency_penalty=1.2,
-                    )
+            # Not part of the cached replay: it describes this run only
+            if selection is not None:
+                yield "model_selection", selection
 
-                    synthesis_text = strip_repetition(
-                        completion.choices[0].message.content
-                    )
+            calls = [
+                (MODEL_CONFIGS[m]["label"], lambda on_chunk, cfg=MODEL_CONFIGS[m]: invoke_model(cfg, on_chunk))
+                for m in selected_models
+            ]
 
-                    payload = {
-                        "type": "synthesis",
-                        "data": {
-                            "model": "GPT-OSS",
-                            "response": synthesis_text,
-                        },
-                    }
-                    yield f"data: {json.dumps(payload)}\n\n"
-
-                except Exception as e:
-                    payload = {
-                        "type": "synthesis",
-                        "data": {
-                            "model": "GPT-OSS",
-                            "error": True,
-                            "response": str(e),
-                        },
-                    }
-                    yield f"data: {json.dumps(payload)}\n\n"
+            # Backstop over the per-call deadlines, like the chat fan-out
+            timeout = fanout_timeout(MODEL_CONFIGS[m]["hf_model"] for m in selected_models)
+            fan = fan_out(calls, timeout=timeout, soft_deadline=soft_deadline)
+            try:
+                async for kind, label, result in fan:
+                    event = model_event(kind, label, result)
+                    if event:
+                        yield event
+
+                    if kind == "chunk":
+                        continue
+                    if kind == "result":
+                        finished += 1
+                        if result.get("success"):
+                            successful.append(result)
+                    elif kind == "deadline":
+                        deadline_passed = True
+                    elif kind == "timeout":
+                        print("[trial] Fan-out timed out, continuing with completed models")
+                        break
+
+                    if enable_synthesis and quorum_reached(
+                        len(successful), finished, len(calls), quorum, min_for_synthesis, deadline_passed
+                    ):
+                        break
+
+                if enable_synthesis and len(successful) >= min_for_synthesis:
+                    async for event in merge(late_responses(fan), synthesize(list(successful))):
+                        yield event
+                else:
+                    async for event in late_responses(fan):
+                        yield event
+            finally:
+                await fan.aclose()
 
             # -------------------------
             # Done
             # -------------------------
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            done = ("done", None)
+            if cacheable:
+                events = tuple(replay + [done])
+                response_cache.put(cache_key, events)
+                semantic_cache.put(base_message, events, namespace=cache_key[1:])
+            # Like model_selection, not replayed from the cache
+            yield "timing", trace.finish()
+            yield done
+
+        # Identical requests already in flight share one upstream run
+        flight_key = ("trial", *cache_key)
+        upstream_calls = len(selected_models) + (1 if enable_synthesis else 0)
 
         return Response(
-            generate(),
+            engine.stream(sse_writer.stream(single_flight.stream(flight_key, generate, upstream_calls))),
             mimetype="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            },
+            headers={**sse_headers, "X-Cache": "MISS"},
         )
 
     except Exception as err:
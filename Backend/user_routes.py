@@ -23,21 +23,20 @@ def get_user_profile():
         return jsonify({"error": "Not logged in"}), 401
 
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-
-        # Get the current user ?
-        cursor.execute("""
-            SELECT id, full_name, email, birth_date
-            FROM users
-            WHERE user_id = %(user_id)s
-        """, {
-            'user_id': user_id
-        })
-
-        row = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
+
+            # Get the current user ?
+            cursor.execute("""
+                SELECT id, full_name, email, birth_date
+                FROM users
+                WHERE user_id = %(user_id)s
+            """, {
+                'user_id': user_id
+            })
+
+            row = cursor.fetchone()
+            cursor.close()
 
         if not row:
             return jsonify({"error": "User not found"}), 404
@@ -71,43 +70,41 @@ def update_user_profile():
         return jsonify({"error": "Not logged in"}), 401
 
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-
-        # Get the current user
-        cursor.execute("""
-        SELECT id
-        FROM users
-        WHERE user_id = &(user_id)s
-        """, {
-            'user_id': user_id
-        })
-        row = cursor.fetchone()
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
 
-        if not row:
+            # Get the current user
+            cursor.execute("""
+            SELECT id
+            FROM users
+            WHERE user_id = &(user_id)s
+            """, {
+                'user_id': user_id
+            })
+            row = cursor.fetchone()
+
+            if not row:
+                cursor.close()
+                return jsonify({"error": "User not found"}), 404
+
+            user_id = row[0]
+
+            # Update user profile
+            cursor.execute("""
+                UPDATE users
+                SET full_name = %(full_name)s,
+                    email = %(email)s,
+                    birth_date = %(birth_date)s
+                WHERE id = %(user_id)s
+            """, {
+                'full_name': full_name,
+                'email': email,
+                'birth_date': birth_date,
+                'user_id': user_id
+            })
+
+            connection.commit()
             cursor.close()
-            connection.close()
-            return jsonify({"error": "User not found"}), 404
-
-        user_id = row[0]
-
-        # Update user profile
-        cursor.execute("""
-            UPDATE users
-            SET full_name = %(full_name)s,
-                email = %(email)s,
-                birth_date = %(birth_date)s
-            WHERE id = %(user_id)s
-        """, {
-            'full_name': full_name,
-            'email': email,
-            'birth_date': birth_date,
-            'user_id': user_id
-        })
-
-        connection.commit()
-        cursor.close()
-        connection.close()
 
         return jsonify({"message": "Profile updated successfully"}), 200
 
@@ -134,47 +131,44 @@ def update_password():
         return jsonify({"error": "Not logged in"}), 401
 
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-
-        # Get the current user
-        cursor.execute("""
-        SELECT id, password
-        FROM users
-        WHERE user_id = %(user_id)s
-        """, {
-            'user_id': user_id
-        })
-        row = cursor.fetchone()
-
-        if not row:
-            cursor.close()
-            connection.close()
-            return jsonify({"error": "User not found"}), 404
-
-        user_id = row[0]
-        stored_hash = row[1]
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
 
-        # Verify current password
-        if not check_password(current_password, stored_hash):
+            # Get the current user
+            cursor.execute("""
+            SELECT id, password
+            FROM users
+            WHERE user_id = %(user_id)s
+            """, {
+                'user_id': user_id
+            })
+            row = cursor.fetchone()
+
+            if not row:
+                cursor.close()
+                return jsonify({"error": "User not found"}), 404
+
+            user_id = row[0]
+            stored_hash = row[1]
+
+            # Verify current password
+            if not check_password(current_password, stored_hash):
+                cursor.close()
+                return jsonify({"error": "Current password is incorrect"}), 401
+
+            # Hash new password and update
+            new_hash = password_hash(new_password)
+            cursor.execute("""
+                UPDATE users
+                SET password = %(password)s
+                WHERE id = %(user_id)s
+            """, {
+                'password': new_hash,
+                'user_id': user_id
+            })
+
+            connection.commit()
             cursor.close()
-            connection.close()
-            return jsonify({"error": "Current password is incorrect"}), 401
-
-        # Hash new password and update
-        new_hash = password_hash(new_password)
-        cursor.execute("""
-            UPDATE users
-            SET password = %(password)s
-            WHERE id = %(user_id)s
-        """, {
-            'password': new_hash,
-            'user_id': user_id
-        })
-
-        connection.commit()
-        cursor.close()
-        connection.close()
 
         return jsonify({"message": "Password updated successfully"}), 200
 
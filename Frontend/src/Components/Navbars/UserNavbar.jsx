@@ -3,78 +3,25 @@ import { useNavigate, useParams, Link } from 'react-router-dom';
 import { HiLightningBolt, MdLogout, AiOutlinePlus, AiOutlineSetting } from '../../assets/Icons';
 import { AiOutlineEdit, AiOutlineDelete, AiOutlineMenuFold, AiOutlineMenuUnfold } from 'react-icons/ai';
 import ConfirmDialog from '../ConfirmDialog';
+import { useChatPersistence } from '../../hooks/useChatPersistence';
 
 
 function UserNavbar({ isOpen = true, onToggle }) {
   const navigate = useNavigate();
   const { chatId } = useParams();
-  const [chats, setChats] = useState([]);
+  const { syncChatsFromBackend, getChatStorageKey } = useChatPersistence();
+  const [chats, setChats] = useState(() => JSON.parse(localStorage.getItem(getChatStorageKey()) || '[]'));
   const [editingChatId, setEditingChatId] = useState(null);
   const [editTitle, setEditTitle] = useState('');
   const [confirmDialog, setConfirmDialog] = useState({ isOpen: false, type: null, chatId: null });
   const [isInitialized, setIsInitialized] = useState(false);
 
-  // Get user-specific storage key
-  const getChatStorageKey = () => {
-    const userId = localStorage.getItem('current_user_id');
-    return userId ? `chats_user_${userId}` : 'chats';
-  };
-
-  // Fetch chats from backend
-  const fetchChatsFromBackend = async () => {
-    try {
-      const response = await fetch('/api/chats', {
-        method: 'GET',
-        credentials: 'include',
-        headers: { 'Content-Type': 'application/json' }
-      });
-      
-      if (response.ok) {
-        const data = await response.json();
-        if (data.success && data.chats) {
-          console.log('[UserNavbar] Backend chats:', data.chats);
-          // Transform backend chats to match frontend format
-          // Backend returns tuples [id, user_message, model_response, created_at]
-          const formattedChats = data.chats.map((chat, index) => {
-            const chatId = Array.isArray(chat) ? chat[0] : chat.id;
-            const userMsg = Array.isArray(chat) ? chat[1] : chat.user_message;
-            const modelResp = Array.isArray(chat) ? chat[2] : chat.model_response;
-            const createdAt = Array.isArray(chat) ? chat[3] : chat.created_at;
-            
-            console.log('[UserNavbar] Transforming chat:', { chatId, hasResponse: !!modelResp });
-            return {
-              id: `chat-${chatId}`,
-              title: userMsg?.substring(0, 30) || 'Chat',
-              createdAt: createdAt,
-              messages: [
-                { id: chatId * 2, text: userMsg || 'User message', sender: 'user' },
-                { id: chatId * 2 + 1, text: modelResp || 'No response', sender: 'bot' }
-              ]
-            };
-          });
-          
-          // Display only backend chats
-          setChats(formattedChats);
-          const storageKey = getChatStorageKey();
-          localStorage.setItem(storageKey, JSON.stringify(formattedChats));
-        }
-      }
-    } catch (error) {
-      console.error('Failed to fetch chats from backend:', error);
-      // Fallback to localStorage if backend fails
-      const storageKey = getChatStorageKey();
-      const savedChats = localStorage.getItem(storageKey);
-      if (savedChats) {
-        setChats(JSON.parse(savedChats));
-      }
-    }
-  };
-
-  // Load chats from backend on mount
+  // Show the localStorage mirror right away, then pull only the chats that
+  // changed since the last sync (the mirror is re-read on 'chats-updated')
   useEffect(() => {
-    fetchChatsFromBackend();
+    syncChatsFromBackend();
     setIsInitialized(true);
-  }, []);
+  }, [syncChatsFromBackend]);
 
   // Save chats to localStorage whenever they change (but only after initial load)
   useEffect(() => {
@@ -238,7 +238,12 @@ function TrialChat({ onClose, initialQuestion = '' }) {
           const jsonStr = line.slice(6);
           try {
             const event = JSON.parse(jsonStr);
-            if (event.type === 'model_response') {
+            if (event.type === 'model_chunk') {
+              const { model, delta } = event.data;
+              const key = model.toLowerCase();
+              allResponses[key] = (allResponses[key] || '') + delta;
+              upsertBotMessage({});
+            } else if (event.type === 'model_response') {
               const { model, response: modelText } = event.data;
               allResponses[model.toLowerCase()] = modelText;
               upsertBotMessage({});
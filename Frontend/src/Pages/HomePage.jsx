@@ -357,6 +357,35 @@ function HomePage() {
     // Collect all responses as they stream in
     const allResponses = {};
 
+    const showModelResponses = () => {
+      setMessages((currentMessages) => {
+        const existingBotMessage = currentMessages.find(
+          (m) => m.sender === 'bot' && m.id === userMessage.id + 1
+        );
+
+        if (existingBotMessage) {
+          return currentMessages.map((m) =>
+            m.id === existingBotMessage.id
+              ? {
+                  ...m,
+                  allResponses: { ...m.allResponses, ...allResponses },
+                }
+              : m
+          );
+        } else {
+
+          const newBotMessage = {
+            id: userMessage.id + 1,
+            text: null,
+            sender: 'bot',
+            model: 'Threadwork AI',
+            allResponses: allResponses,
+          };
+          return [...currentMessages, newBotMessage];
+        }
+      });
+    };
+
     try {
       await streamChat(
         savedInput,
@@ -370,33 +399,7 @@ function HomePage() {
             firstModelMs = performance.now() - startTs;
           }
 
-
-          setMessages((currentMessages) => {
-            const existingBotMessage = currentMessages.find(
-              (m) => m.sender === 'bot' && m.id === userMessage.id + 1
-            );
-
-            if (existingBotMessage) {
-              return currentMessages.map((m) =>
-                m.id === existingBotMessage.id
-                  ? {
-                      ...m,
-                      allResponses: { ...m.allResponses, ...allResponses },
-                    }
-                  : m
-              );
-            } else {
-
-              const newBotMessage = {
-                id: userMessage.id + 1,
-                text: null,
-                sender: 'bot',
-                model: 'Threadwork AI',
-                allResponses: allResponses,
-              };
-              return [...currentMessages, newBotMessage];
-            }
-          });
+          showModelResponses();
         },
   
         // onSynthesisChunk — accumulate streamed synthesis tokens
@@ -486,7 +489,18 @@ function HomePage() {
             return merged;
           });
         }
-      , abortController.signal);
+      , abortController.signal,
+        // onModelChunk - partial model text as tokens arrive
+        ({ model, delta }) => {
+          const key = model.toLowerCase();
+          allResponses[key] = (allResponses[key] || '') + delta;
+
+          if (firstModelMs === null) {
+            firstModelMs = performance.now() - startTs;
+          }
+
+          showModelResponses();
+        });
     } catch (err) {
       if (err?.name === 'AbortError') {
         setIsLoading(false);
@@ -108,28 +108,67 @@ export const useChatPersistence = () => {
     }
   }, [formatChatForDatabase, getChatStorageKey]);
 
-  // Fetch chats from backend
-  const fetchChatsFromBackend = useCallback(async () => {
+  // Pull only chats changed since the last sync into the localStorage mirror.
+  // Returns true when the mirror changed.
+  const syncChatsFromBackend = useCallback(async () => {
+    const storageKey = getChatStorageKey();
+    const versionKey = `${storageKey}_sync_version`;
+    let version = localStorage.getItem(versionKey);
+    let changedAny = false;
+
     try {
-      const response = await fetch('/api/chats', {
-        method: 'GET',
-        headers: { 'Content-Type': 'application/json' }
-      });
-      if (!response.ok) {
-        throw new Error(`Failed to fetch chats: ${response.status}`);
+      let hasMore = true;
+      while (hasMore) {
+        const params = new URLSearchParams();
+        if (version !== null) params.set('since', version);
+        const response = await fetch(`/api/chats/sync?${params}`, {
+          method: 'GET',
+          credentials: 'include',
+          headers: version !== null ? { 'If-None-Match': `W/"chats-${version}"` } : {}
+        });
+        if (response.status === 304) break;
+        if (!response.ok) {
+          throw new Error(`Failed to sync chats: ${response.status}`);
+        }
+
+        const data = await response.json();
+        const changedIds = new Set(data.changed.map(c => `chat-${c.id}`));
+        const deletedIds = new Set(data.deleted.map(id => `chat-${id}`));
+        const existing = data.full ? [] : JSON.parse(localStorage.getItem(storageKey) || '[]');
+        const kept = existing.filter(c => !changedIds.has(c.id) && !deletedIds.has(c.id));
+        const incoming = data.changed.map(chat => ({
+          id: `chat-${chat.id}`,
+          title: chat.chat_name || chat.user_message?.substring(0, 30) || 'Chat',
+          createdAt: chat.created_at,
+          messages: [
+            { id: chat.id * 2, text: chat.user_message || 'User message', sender: 'user' },
+            { id: chat.id * 2 + 1, text: chat.model_response || 'No response', sender: 'bot' }
+          ]
+        }));
+        const merged = [...incoming, ...kept].sort(
+          (a, b) => new Date(b.createdAt) - new Date(a.createdAt)
+        );
+
+        localStorage.setItem(storageKey, JSON.stringify(merged));
+        version = String(data.version);
+        localStorage.setItem(versionKey, version);
+        changedAny = true;
+        hasMore = data.has_more;
       }
-      const data = await response.json();
-      return data.chats || [];
     } catch (error) {
-      console.error('Failed to fetch chats from backend:', error);
-      return [];
+      console.error('Failed to sync chats from backend:', error);
     }
-  }, []);
+
+    if (changedAny) {
+      window.dispatchEvent(new Event('chats-updated'));
+    }
+    return changedAny;
+  }, [getChatStorageKey]);
 
   return {
     persistChats,
     saveChatToDatabase,
-    fetchChatsFromBackend,
+    syncChatsFromBackend,
     formatChatForDatabase,
     getChatStorageKey,
   };
@@ -6,6 +6,8 @@
  * @param {function} onSynthesisChunk - Callback for each synthesis token
  * @param {function} onDone - Callback when stream is complete
  * @param {function} onError - Callback on error
+ * @param {AbortSignal} signal - Aborts the request
+ * @param {function} onModelChunk - Callback for each streamed model token ({ model, delta })
  */
 export async function streamChat(
   message,
@@ -14,7 +16,8 @@ export async function streamChat(
   onSynthesisChunk,
   onDone,
   onError,
-  signal
+  signal,
+  onModelChunk
 ) {
   try {
     const response = await fetch('/api/chat', {
@@ -52,7 +55,9 @@ export async function streamChat(
           try {
             const event = JSON.parse(jsonStr);
 
-            if (event.type === 'model_response') {
+            if (event.type === 'model_chunk') {
+              onModelChunk?.(event.data);
+            } else if (event.type === 'model_response') {
               onModelResponse(event.data);
             } else if (event.type === 'synthesis_chunk') {
               onSynthesisChunk(event.data);